@@ -1,7 +1,5 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv()  # Load environment variables from a .env file
+from app.config import env  # Load environment variables from the .env file
 
 # Cloudinary API Credentials
 CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
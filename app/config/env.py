@@ -0,0 +1,6 @@
+from dotenv import load_dotenv
+
+# Load environment variables from the .env file once for the whole app.
+# Modules that read settings import this module instead of calling
+# load_dotenv() themselves; Python only executes it on the first import.
+load_dotenv()
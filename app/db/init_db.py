@@ -1,16 +1,65 @@
+import asyncio
+from sqlalchemy import DateTime, text
 from app.db.session import engine, Base
 from app.models.user import User
 from app.models.document import Document
 from app.models.chat_history import ChatHistory
+from app.models.document_chunk import DocumentChunk
 
-def init_db():
+# Indexes replaced by, or made redundant by, another index in the models
+RETIRED_INDEXES = ("ix_documents_user_uploaded", "ix_chat_history_document_id")
+
+def _server_default_sql(connection, column) -> str:
+    default = column.server_default.arg
+    if isinstance(default, str):
+        return "'" + default.replace("'", "''") + "'"
+    return str(default.compile(dialect=connection.dialect))
+
+def _create_schema(connection):
+    Base.metadata.create_all(bind=connection)
+    # Tables created before the timestamp columns became timestamptz hold
+    # naive UTC values written by the app. Convert them so they compare with
+    # the server-stamped rows; USING keeps the stored values meaning UTC.
+    naive_columns = set(connection.execute(text(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND data_type = 'timestamp without time zone'"
+    )).all())
+    # create_all skips tables that already exist, so add any indexes and
+    # server-side defaults that were declared after the table was first created
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if (isinstance(column.type, DateTime) and column.type.timezone
+                    and (table.name, column.name) in naive_columns):
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" '
+                    f"TYPE timestamptz USING \"{column.name}\" AT TIME ZONE 'UTC'"
+                ))
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+        for column in table.columns:
+            if column.server_default is not None:
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" '
+                    f"SET DEFAULT {_server_default_sql(connection, column)}"
+                ))
+    for index_name in RETIRED_INDEXES:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+
+async def init_db():
     print("creating tables")
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(_create_schema)
     print("created tables successfully")
     
-def close_db_connection():
+async def close_db_connection():
     print("closing database connections")
     if engine:
-        engine.dispose()
+        await engine.dispose()
     print("database connections closed")
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    async def main():
+        await init_db()
+        await close_db_connection()
+
+    asyncio.run(main())
@@ -1,30 +1,78 @@
-from  sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool
+import logging
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import time
+from uuid import uuid4
+from app.config import env  # Load environment variables from the .env file
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,              # Adjust based on expected load
-    max_overflow=20,           # Additional connections when pool is full
-    pool_timeout=30,           # Seconds to wait for a connection from pool
-    pool_recycle=1800          # Recycle connections after 30 minutes
-)
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))          # Seconds to wait for a connection from pool
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # Recycle connections after 30 minutes
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000"))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))      # Log statements slower than this
+
+# "default" uses SQLAlchemy's pool. "nullpool" is for deployments behind
+# PgBouncer in transaction mode, where PgBouncer already pools connections and
+# checks their health, so pre-ping would only add a round-trip per checkout.
+POOL_STRATEGY = os.getenv("POOL_STRATEGY", "default")
+
+database_url = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+if POOL_STRATEGY == "nullpool":
+    # PgBouncer can't keep prepared statements across transactions, and the
+    # statements SQLAlchemy still prepares need names that can't collide on a
+    # server connection shared with other clients
+    database_url = database_url.update_query_dict({"prepared_statement_cache_size": "0"})
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+    pool_options = {"poolclass": NullPool}
+else:
+    # Abort runaway queries instead of letting them hold a connection
+    connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    pool_options = {
+        "pool_pre_ping": True,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+# A plain postgresql:// URL is accepted and run on the asyncpg driver
+engine = create_async_engine(database_url, connect_args=connect_args, **pool_options)
 
-SessionLocal = sessionmaker(autocommit = False,autoflush=False,bind=engine)
+logger = logging.getLogger(__name__)
+
+if POOL_STRATEGY == "nullpool":
+    # PgBouncer rejects statement_timeout as a startup parameter, so it is set
+    # for each transaction instead
+    @event.listens_for(engine.sync_engine, "begin")
+    def _set_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+    if elapsed_ms > DB_SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", elapsed_ms, statement)
+
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-        
\ No newline at end of file
@@ -1,7 +1,46 @@
+import hashlib
+import time
+from functools import wraps
+from threading import Lock
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status, Header
 from app.utils.firebase import verify_token
+from app.services.cloudinary_upload_service import CloudinaryUploadService
+from app.services.langchain_document_service import LangChainDocumentService
+from app.services.rag_service import RAGService
+from app.services.semantic_cache_service import SemanticCacheService
+from app.services.chat_history_writer import ChatHistoryWriter
+from app.db.session import SessionLocal
 
-async def get_current_user(authorization: str = Header(None)):
+# Decoded Firebase tokens keyed by a 128-bit BLAKE2b digest of the ID token, so
+# raw tokens aren't kept in memory. Entries also expire early if the token itself
+# is about to run out.
+TOKEN_CACHE_TTL = 300
+TOKEN_EXPIRY_MARGIN = 30
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = Lock()
+
+def verify_token_cached(id_token: str) -> dict:
+    """Verify a Firebase ID token, reusing the decoded claims for repeat requests"""
+    cache_key = hashlib.blake2b(id_token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        decoded_token = _token_cache.get(cache_key)
+    
+    if decoded_token is not None:
+        if decoded_token["exp"] - time.time() > TOKEN_EXPIRY_MARGIN:
+            return decoded_token
+        with _token_cache_lock:
+            _token_cache.pop(cache_key, None)
+    
+    decoded_token = verify_token(id_token)
+    
+    if decoded_token.get("exp", 0) - time.time() > TOKEN_EXPIRY_MARGIN:
+        with _token_cache_lock:
+            _token_cache[cache_key] = decoded_token
+    
+    return decoded_token
+
+def get_current_user(authorization: str = Header(None)):
     
     if authorization is None or not authorization.startswith("Bearer "):
         raise HTTPException(
@@ -9,9 +48,56 @@ async def get_current_user(authorization: str = Header(None)):
             detail="Invalid authentication credentials",
         )
     
-   
-    id_token = authorization.split("Bearer ")[1]
+    id_token = authorization[7:].strip()
+    
+    if not id_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
     
+    # Declared sync so FastAPI runs it in the threadpool; a cache miss makes a
+    # blocking Firebase verification call
+    decoded_token = verify_token_cached(id_token)
+    return decoded_token
+
+def singleton(factory):
+    """Build the factory's result once, on first use.
+
+    Sync dependencies run in the threadpool, so concurrent first requests could
+    otherwise each build their own instance.
+    """
+    lock = Lock()
+    instances = []
     
-    decoded_token = verify_token(id_token)
-    return decoded_token
\ No newline at end of file
+    @wraps(factory)
+    def get_instance():
+        if not instances:
+            with lock:
+                if not instances:
+                    instances.append(factory())
+        return instances[0]
+    return get_instance
+
+# Services are built on first use rather than at import time so that
+# startup doesn't pay for the embedding model, Qdrant and LLM clients
+@singleton
+def get_cloudinary_service() -> CloudinaryUploadService:
+    return CloudinaryUploadService()
+
+@singleton
+def get_doc_service() -> LangChainDocumentService:
+    return LangChainDocumentService()
+
+@singleton
+def get_rag_service() -> RAGService:
+    # Share the document service, and with it the embedding batcher, with uploads
+    return RAGService(get_doc_service(), get_chat_history_writer())
+
+@singleton
+def get_semantic_cache() -> SemanticCacheService:
+    return SemanticCacheService()
+
+@singleton
+def get_chat_history_writer() -> ChatHistoryWriter:
+    return ChatHistoryWriter(SessionLocal)
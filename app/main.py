@@ -1,38 +1,57 @@
-from fastapi import FastAPI, Request
+from app.config import env  # Load environment variables before anything reads them
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-import time
 
+from app.middleware.profiling import ProfilingMiddleware, PROFILING_ENABLED
 from app.utils.firebase import initialize_firebase
+from app.utils.cache import initialize_cache
 from app.db.init_db import init_db, close_db_connection
+from app.dependencies import get_chat_history_writer
+from app.services.langchain_document_service import shutdown_ingest_pool
+from app.services.embedding_service import warm_up_embeddings
 from app.routes.user_routes import user_router
 from app.routes.document_routes import document_router
 
-app = FastAPI()
+# Logging is configured by the application only; service modules just create
+# their loggers, so importing them (e.g. in ingest workers) changes nothing
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Outside dev the schema is created/updated by running `python -m app.db.init_db`
+# as a pre-start step, so workers don't repeat it on every boot
+APP_ENV = os.getenv("APP_ENV", "dev")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    initialize_firebase()
+    initialize_cache()
+    # Loading the ONNX session and its first run take seconds; do it before
+    # the worker accepts traffic rather than inside the first chat request
+    await run_in_threadpool(warm_up_embeddings)
+    if APP_ENV == "dev":
+        await init_db()
+    yield
+    # Write any queued chat turns before the engine goes away
+    await get_chat_history_writer().close()
+    await close_db_connection()
+    shutdown_ingest_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
-
-@app.on_event("startup")
-def startup():
-    initialize_firebase()  
-    init_db()  
-    
-@app.on_event("shutdown")
-def shutdown():
-    close_db_connection()
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 app.include_router(user_router)
 app.include_router(document_router)
\ No newline at end of file
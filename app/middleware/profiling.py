@@ -0,0 +1,54 @@
+import os
+from urllib.parse import parse_qs
+
+# Profiling is a development aid; keep it off unless explicitly enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles a request on demand.
+
+    A request opts in with an ``X-Profile`` header or a ``profile=1`` query
+    parameter and receives the pyinstrument HTML report instead of the normal
+    response. Every other request is passed through untouched.
+    """
+
+    def __init__(self, app, interval: float = 0.001):
+        from pyinstrument import Profiler
+
+        self.app = app
+        self.profiler_class = Profiler
+        self.interval = interval
+
+    @staticmethod
+    def _profiling_requested(scope) -> bool:
+        if any(name == b"x-profile" for name, _ in scope["headers"]):
+            return True
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("profile") == ["1"]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        async def discard_response(message):
+            pass
+
+        profiler = self.profiler_class(async_mode="enabled", interval=self.interval)
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard_response)
+        finally:
+            profiler.stop()
+
+        body = profiler.output_html().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/html; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,18 +1,22 @@
-import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql import func
 from app.db.session import Base
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    # Serves recent-turn lookups per user and document, newest first, and
+    # per-document history in order; also covers lookups by document_id alone
+    __table_args__ = (Index("ix_chat_doc_user_ts", "document_id", "user_id", "timestamp"),)
 
-    id = Column(String, primary_key=True, default=lambda: f"CHAT-{uuid.uuid4().hex[:8]}")  # Auto UUID
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    id = Column(String, primary_key=True, server_default=text("'CHAT-' || replace(gen_random_uuid()::text, '-', '')"))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
     user_message = Column(String, nullable=False)
     bot_response = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    # clock_timestamp() rather than now(): history is ordered by this column and
+    # now() is fixed for the whole transaction
+    timestamp = Column(DateTime(timezone=True), server_default=func.clock_timestamp())
 
     user = relationship("User", backref="chats")
-    document = relationship("Document", backref="chats")
+    document = relationship("Document", back_populates="chat_history")
@@ -1,16 +1,26 @@
-import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql import func
 from app.db.session import Base
 
 class Document(Base):
     __tablename__ = "documents"
+    # Serves the per-user listing newest first (scanned backwards), with id
+    # breaking ties between equal upload times; it also covers plain user_id
+    # lookups
+    __table_args__ = (Index("ix_documents_user_uploaded_id", "user_id", "uploaded_at", "id"),)
 
-    id = Column(String, primary_key=True, default=lambda: f"DOC-{uuid.uuid4().hex[:8]}")  # Auto UUID
+    id = Column(String, primary_key=True, server_default=text("'DOC-' || replace(gen_random_uuid()::text, '-', '')"))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
     file_url = Column(String, nullable=False)  
-    uploaded_at = Column(DateTime, default=datetime.utcnow)
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", backref="documents")
+    # Must be eager-loaded explicitly; lazy loading can't run under AsyncSession
+    chat_history = relationship(
+        "ChatHistory",
+        back_populates="document",
+        order_by="ChatHistory.timestamp",
+        lazy="raise"
+    )
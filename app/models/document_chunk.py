@@ -1,17 +1,18 @@
-import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text, Index, text
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql import func
 from app.db.session import Base
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    # Also serves lookups by document_id alone
+    __table_args__ = (Index("ix_chunk_doc_idx", "document_id", "chunk_index"),)
 
-    id = Column(String, primary_key=True, default=lambda: f"CHUNK-{uuid.uuid4().hex[:8]}")
+    id = Column(String, primary_key=True, server_default=text("'CHUNK-' || replace(gen_random_uuid()::text, '-', '')"))
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
     vector_db_id = Column(String, nullable=False)  # ID in vector database
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     document = relationship("Document", backref="chunks") 
\ No newline at end of file
@@ -1,9 +1,12 @@
 from sqlalchemy import Column, String, DateTime, Boolean
-from datetime import datetime
+from sqlalchemy.sql import func
 from app.db.session import Base
 
 class User(Base):
     __tablename__ = "users"
+    # Fetch the server-generated timestamps with RETURNING on INSERT and UPDATE
+    # instead of a separate refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(String, primary_key=True) 
     email = Column(String, unique=True, nullable=False)
@@ -13,5 +16,5 @@ class User(Base):
     location = Column(String, nullable=True)
     bio = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
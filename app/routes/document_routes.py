@@ -1,66 +1,176 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Body
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+import asyncio
+import json
+import logging
+from contextlib import suppress
+import os
+import aiofiles
+import aiofiles.os
+import aiofiles.tempfile
+from fastapi import APIRouter, Depends, HTTPException, Query, status, File, UploadFile, Body
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists, lambda_stmt, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from fastapi_cache.decorator import cache
+from pydantic import TypeAdapter
 
 from app.db.session import get_db
-from app.dependencies import get_current_user
+from app.dependencies import (
+    get_current_user, get_cloudinary_service,
+    get_doc_service, get_rag_service, get_semantic_cache,
+    get_chat_history_writer
+)
 from app.models.document import Document
-from app.models.chat_history import ChatHistory
-from app.models.document_chunk import DocumentChunk
 from app.services.cloudinary_upload_service import CloudinaryUploadService
-from app.services.langchain_document_service import LangChainDocumentService, COLLECTION_NAME
+from app.services.langchain_document_service import LangChainDocumentService
 from app.services.rag_service import RAGService
+from app.services.semantic_cache_service import SemanticCacheService
+from app.services.chat_history_writer import ChatHistoryWriter
 from app.schemas.document import (
-    DocumentChatRequest,
+    DocumentChatRequest, DocumentChatBatchRequest,
     DocumentUploadResponse, DocumentChatResponse,
+    DocumentChatBatchResponse,
     DocumentChatHistoryResponse, DocumentListResponse,
     DocumentListEntry
 )
 from app.services.file_validation_service import FileValidationService
+from app.utils.cache import (
+    DOCUMENT_LIST_CACHE_TTL, CHAT_HISTORY_CACHE_TTL,
+    document_list_key_builder, chat_history_key_builder,
+    invalidate_document_list, invalidate_chat_history
+)
 
 document_router = APIRouter(prefix="/documents", tags=["documents"])
 
-cloudinary_service = CloudinaryUploadService()
-doc_service = LangChainDocumentService()
-rag_service = RAGService()
+logger = logging.getLogger(__name__)
+
+# Read size when spooling an upload to disk
+UPLOAD_SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Documents returned per page of the document list
+DOCUMENT_LIST_PAGE_SIZE = 50
+
+# Validates all listed rows in one call
+document_list_adapter = TypeAdapter(List[DocumentListEntry])
+
+# Chunks and chat history are only deleted when the ownership check on the
+# document row succeeds. Foreign keys are checked at the end of the statement,
+# so parent and child rows can be removed together.
+DELETE_DOCUMENT_SQL = """
+WITH deleted_document AS (
+    DELETE FROM documents
+    WHERE id = :document_id AND user_id = :user_id
+    RETURNING id, title
+),
+deleted_chunks AS (
+    DELETE FROM document_chunks
+    WHERE document_id IN (SELECT id FROM deleted_document)
+),
+deleted_chat_history AS (
+    DELETE FROM chat_history
+    WHERE document_id IN (SELECT id FROM deleted_document)
+)
+SELECT (SELECT title FROM deleted_document) AS title
+"""
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Format one server-sent event; multi-line data is split over data: lines"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+async def discard_failed_upload(
+    doc_service: LangChainDocumentService,
+    cloudinary_service: CloudinaryUploadService,
+    document_id: str,
+    upload_result: Any
+) -> None:
+    """Remove the vectors and the Cloudinary asset of an upload whose rows were rolled back"""
+    try:
+        await run_in_threadpool(doc_service.delete_document_vectors, document_id)
+    except Exception:
+        logger.warning("Failed to delete vectors of failed upload %s", document_id, exc_info=True)
+    # upload_result is an exception when the Cloudinary upload itself failed
+    if isinstance(upload_result, dict):
+        try:
+            await cloudinary_service.delete_upload(upload_result)
+        except Exception:
+            logger.warning("Failed to delete Cloudinary asset of failed upload %s", document_id, exc_info=True)
+
+async def user_owns_document(db: AsyncSession, document_id: str, user_id: str) -> bool:
+    """Check that a document exists and belongs to the given user"""
+    # lambda_stmt caches the statement construction for this hot lookup
+    result = await db.execute(lambda_stmt(
+        lambda: select(exists().where(
+            Document.id == document_id,
+            Document.user_id == user_id
+        ))
+    ))
+    return result.scalar()
 
 @document_router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
     title: str = Body(...),
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    cloudinary_service: CloudinaryUploadService = Depends(get_cloudinary_service),
+    doc_service: LangChainDocumentService = Depends(get_doc_service)
 ):
+    temp_file_path = None
+    document_id = None
+    upload_result = None
+    committed = False
     try:
         user_id = current_user["uid"]
         
-        FileValidationService.validate_file(file, 'document')
+        # Reject oversized uploads from the size recorded while parsing them
+        if file.size is not None:
+            FileValidationService.validate_file_size(file.size, 'document')
         
-        file_url = cloudinary_service.upload_file(
-            file,
-            'document',
-            user_id
-        )
+        # Spool the upload to disk once. Validation, Cloudinary and the
+        # document loader all read this file instead of the request body.
+        file_extension = os.path.splitext(file.filename)[1].lower()
+        async with aiofiles.tempfile.NamedTemporaryFile('wb', delete=False, suffix=file_extension) as temp_file:
+            temp_file_path = temp_file.name
+            while chunk := await file.read(UPLOAD_SPOOL_CHUNK_SIZE):
+                await temp_file.write(chunk)
         
+        await FileValidationService.validate_path(temp_file_path, 'document')
+        
+        # Flush the document row to get its id. It is only committed once the
+        # upload and the chunks are both in place.
         document = Document(
             user_id=user_id,
             title=title,
-            file_url=file_url
+            file_url=""
         )
-        
         db.add(document)
-        db.commit()
-        db.refresh(document)
+        await db.flush()
         document_id = document.id
         
-        await file.seek(0)
-        
-        processing_result = await doc_service.process_document(
-            db=db,
-            file=file,
-            document_id=document_id,
-            user_id=user_id
+        upload_result, processing_result = await asyncio.gather(
+            cloudinary_service.upload_path(temp_file_path, file.filename, 'document', user_id),
+            doc_service.process_document(
+                db=db,
+                file_path=temp_file_path,
+                document_id=document_id,
+                user_id=user_id
+            ),
+            return_exceptions=True
         )
+        for outcome in (upload_result, processing_result):
+            if isinstance(outcome, BaseException):
+                raise outcome
+        
+        file_url = upload_result["secure_url"]
+        document.file_url = file_url
+        await db.commit()
+        committed = True
+        await invalidate_document_list(user_id)
         
         return {
             "document_id": document_id,
@@ -70,57 +180,207 @@ async def upload_document(
         }
         
     except HTTPException as e:
+        await db.rollback()
         raise e
     except Exception as e:
-        if 'document' in locals() and 'db' in locals():
-            db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}"
         )
+    finally:
+        # Rolling back only undoes the rows; whatever either branch of the
+        # gather already wrote to Qdrant or Cloudinary is removed here
+        if document_id is not None and not committed:
+            await discard_failed_upload(doc_service, cloudinary_service, document_id, upload_result)
+        if temp_file_path:
+            with suppress(FileNotFoundError):
+                await aiofiles.os.remove(temp_file_path)
 
 @document_router.post("/chat/{document_id}", response_model=DocumentChatResponse)
 async def chat_with_document(
     document_id: str,
     request: DocumentChatRequest,
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    chat_history_writer: ChatHistoryWriter = Depends(get_chat_history_writer),
+    current_user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    semantic_cache: SemanticCacheService = Depends(get_semantic_cache)
 ):
     try:
         user_id = current_user["uid"]
         
-        document = db.query(Document).filter(
-            Document.id == document_id,
-            Document.user_id == user_id
-        ).first()
+        if not await user_owns_document(db, document_id, user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or doesn't belong to you"
+            )
         
-        if not document:
+        # Near-identical questions about the same document reuse the earlier
+        # answer. The embedding is also used for the vector search on a miss.
+        query_embedding = await run_in_threadpool(
+            rag_service.doc_service.embeddings.embed_query, request.message
+        )
+        result = semantic_cache.lookup(user_id, document_id, query_embedding)
+        
+        if result is None:
+            chat_history = await rag_service.get_chat_history(db, user_id, document_id)
+            
+            result = await rag_service.query_document(
+                query=request.message,
+                document_id=document_id,
+                db=db,
+                chat_history=chat_history,
+                query_embedding=query_embedding
+            )
+            
+            # Don't cache the "nothing found" reply
+            if result["source_documents"]:
+                semantic_cache.store(user_id, document_id, query_embedding, result)
+        
+        # Queued for the writer's next batched insert
+        interactions = [(request.message, result["answer"])]
+        await chat_history_writer.enqueue(user_id=user_id, document_id=document_id, interactions=interactions)
+        rag_service.record_chat_turns(user_id, document_id, interactions)
+        
+        return {
+            "answer": result["answer"],
+            "document_id": document_id,
+            "source_documents": result["source_documents"]
+        }
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {str(e)}"
+        )
+
+@document_router.post("/chat/{document_id}/stream")
+async def stream_chat_with_document(
+    document_id: str,
+    request: DocumentChatRequest,
+    db: AsyncSession = Depends(get_db),
+    chat_history_writer: ChatHistoryWriter = Depends(get_chat_history_writer),
+    current_user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    semantic_cache: SemanticCacheService = Depends(get_semantic_cache)
+):
+    try:
+        user_id = current_user["uid"]
+        
+        if not await user_owns_document(db, document_id, user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or doesn't belong to you"
+            )
+        
+        query_embedding = await run_in_threadpool(
+            rag_service.doc_service.embeddings.embed_query, request.message
+        )
+        cached = semantic_cache.lookup(user_id, document_id, query_embedding)
+        
+        # All database work happens here; the session is closed by the time
+        # the body is streamed
+        if cached is None:
+            chat_history = await rag_service.get_chat_history(db, user_id, document_id)
+            chunks = await rag_service.retrieve_context(
+                request.message, document_id, db, query_embedding=query_embedding
+            )
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {str(e)}"
+        )
+    
+    async def answer_events():
+        if cached is not None:
+            answer = cached["answer"]
+            sources = cached["source_documents"]
+            yield sse_event(answer)
+        else:
+            parts = []
+            try:
+                async for token in rag_service.stream_answer(request.message, document_id, chunks, chat_history):
+                    parts.append(token)
+                    yield sse_event(token)
+            except Exception as e:
+                # The response has already started, so the failure can only
+                # be reported in the stream itself
+                logger.error("Streaming answer for document %s failed", document_id, exc_info=True)
+                yield sse_event(json.dumps({"detail": f"Failed to query document: {str(e)}"}), event="error")
+                return
+            answer = "".join(parts)
+            # Same sources as the non-streaming chat for the same answer
+            sources = rag_service.answer_sources(request.message, chunks)
+            if chunks:
+                semantic_cache.store(user_id, document_id, query_embedding, {
+                    "answer": answer,
+                    "source_documents": sources,
+                    "document_id": document_id
+                })
+        yield sse_event(json.dumps({"source_documents": sources}), event="sources")
+        
+        interactions = [(request.message, answer)]
+        await chat_history_writer.enqueue(user_id=user_id, document_id=document_id, interactions=interactions)
+        rag_service.record_chat_turns(user_id, document_id, interactions)
+    
+    return StreamingResponse(
+        answer_events(),
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@document_router.post("/chat/{document_id}/batch", response_model=DocumentChatBatchResponse)
+async def chat_with_document_batch(
+    document_id: str,
+    request: DocumentChatBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    chat_history_writer: ChatHistoryWriter = Depends(get_chat_history_writer),
+    current_user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        user_id = current_user["uid"]
+        
+        # Ownership and chat history are looked up once for all messages
+        if not await user_owns_document(db, document_id, user_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Document not found or doesn't belong to you"
             )
         
-        chat_history = rag_service.get_chat_history(db, user_id, document_id)
+        chat_history = await rag_service.get_chat_history(db, user_id, document_id)
         
-        result = rag_service.query_document(
-            query=request.message,
+        results = await rag_service.query_document_batch(
+            queries=request.messages,
             document_id=document_id,
             db=db,
             chat_history=chat_history
         )
         
-        rag_service.save_chat_history(
-            db=db,
-            user_id=user_id,
-            document_id=document_id,
-            user_message=request.message,
-            bot_response=result["answer"]
-        )
+        interactions = [
+            (message, result["answer"])
+            for message, result in zip(request.messages, results)
+        ]
+        await chat_history_writer.enqueue(user_id=user_id, document_id=document_id, interactions=interactions)
+        rag_service.record_chat_turns(user_id, document_id, interactions)
         
         return {
-            "answer": result["answer"],
             "document_id": document_id,
-            "source_documents": result["source_documents"]
+            "answers": [
+                {
+                    "answer": result["answer"],
+                    "document_id": document_id,
+                    "source_documents": result["source_documents"]
+                }
+                for result in results
+            ]
         }
         
     except HTTPException as e:
@@ -132,18 +392,25 @@ async def chat_with_document(
         )
 
 @document_router.get("/chat/{document_id}/history", response_model=DocumentChatHistoryResponse)
+@cache(expire=CHAT_HISTORY_CACHE_TTL, namespace="chat", key_builder=chat_history_key_builder)
 async def get_document_chat_history(
     document_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     try:
         user_id = current_user["uid"]
         
-        document = db.query(Document).filter(
-            Document.id == document_id,
-            Document.user_id == user_id
-        ).first()
+        # Load the document and its chat history in one joined query
+        result = await db.execute(
+            select(Document)
+            .options(joinedload(Document.chat_history))
+            .where(
+                Document.id == document_id,
+                Document.user_id == user_id
+            )
+        )
+        document = result.unique().scalar_one_or_none()
         
         if not document:
             raise HTTPException(
@@ -151,10 +418,8 @@ async def get_document_chat_history(
                 detail="Document not found or doesn't belong to you"
             )
         
-        history_entries = rag_service.get_full_chat_history(db, user_id, document_id)
-        
         chat_history = []
-        for entry in history_entries:
+        for entry in document.chat_history:
             chat_history.append({
                 "id": entry.id,
                 "timestamp": entry.timestamp,
@@ -177,26 +442,50 @@ async def get_document_chat_history(
         )
 
 @document_router.get("/list", response_model=DocumentListResponse)
+@cache(expire=DOCUMENT_LIST_CACHE_TTL, namespace="docs", key_builder=document_list_key_builder)
 async def list_documents(
-    db: Session = Depends(get_db),
+    cursor: Optional[datetime] = Query(None),
+    cursor_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     try:
         user_id = current_user["uid"]
-        documents = db.query(Document).filter(Document.user_id == user_id).all()
-        
-        document_list = [
-            DocumentListEntry(
-                id=doc.id,
-                title=doc.title,
-                file_url=doc.file_url,
-                uploaded_at=doc.uploaded_at
+        
+        if (cursor is None) != (cursor_id is None):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="cursor and cursor_id must be passed together"
             )
-            for doc in documents
-        ]
+        # Select only the listed columns to skip ORM object hydration
+        stmt = lambda_stmt(
+            lambda: select(
+                Document.id,
+                Document.title,
+                Document.file_url,
+                Document.uploaded_at
+            ).where(Document.user_id == user_id)
+        )
+        # Keyset pagination: continue below the last (upload time, id) already
+        # seen, so documents uploaded at the same instant aren't skipped
+        if cursor is not None:
+            stmt += lambda s: s.where(tuple_(Document.uploaded_at, Document.id) < tuple_(cursor, cursor_id))
+        stmt += lambda s: s.order_by(
+            Document.uploaded_at.desc(), Document.id.desc()
+        ).limit(DOCUMENT_LIST_PAGE_SIZE)
+        result = await db.execute(stmt)
         
-        return {"documents": document_list}
+        document_list = document_list_adapter.validate_python(result.all(), from_attributes=True)
         
+        next_cursor = None
+        if len(document_list) == DOCUMENT_LIST_PAGE_SIZE:
+            last = document_list[-1]
+            next_cursor = {"uploaded_at": last.uploaded_at, "id": last.id}
+        
+        return {"documents": document_list, "next_cursor": next_cursor}
+        
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -206,70 +495,53 @@ async def list_documents(
 @document_router.delete("/{document_id}", response_model=dict)
 async def delete_document(
     document_id: str,
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    doc_service: LangChainDocumentService = Depends(get_doc_service),
+    semantic_cache: SemanticCacheService = Depends(get_semantic_cache)
 ):
     try:
         user_id = current_user["uid"]
         
-        document = db.query(Document).filter(
-            Document.id == document_id,
-            Document.user_id == user_id
-        ).first()
+        # Delete the document, its chunks and its chat history in a single
+        # statement
+        result = await db.execute(
+            text(DELETE_DOCUMENT_SQL),
+            {"document_id": document_id, "user_id": user_id}
+        )
+        deleted = result.one()
         
-        if not document:
+        if deleted.title is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Document not found or doesn't belong to you"
             )
         
-        # Get all document chunks to find vector_db_ids
-        chunks = db.query(DocumentChunk).filter(
-            DocumentChunk.document_id == document_id
-        ).all()
-        
-        vector_ids = [chunk.vector_db_id for chunk in chunks]
-        
-        # Delete vectors from Qdrant if available
-        if vector_ids and len(vector_ids) > 0:
-            try:
-                # Get Qdrant client
-                qdrant_client = doc_service.client
-                if qdrant_client:
-                    # Delete vectors from Qdrant collection
-                    qdrant_client.delete(
-                        collection_name=COLLECTION_NAME,
-                        points_selector=vector_ids
-                    )
-            except Exception:
-                # Continue with deletion even if Qdrant deletion fails
-                pass
-        
-        # Delete chat history
-        db.query(ChatHistory).filter(
-            ChatHistory.document_id == document_id
-        ).delete(synchronize_session=False)
-        
-        # Delete document chunks
-        db.query(DocumentChunk).filter(
-            DocumentChunk.document_id == document_id
-        ).delete(synchronize_session=False)
-        
-        # Delete the document
-        db.delete(document)
-        
         # Commit all changes
-        db.commit()
+        await db.commit()
+        await invalidate_document_list(user_id)
+        await invalidate_chat_history(user_id, document_id)
+        semantic_cache.invalidate(user_id, document_id)
+        doc_service.invalidate_search_cache(document_id)
+        
+        # Delete by the document_id payload rather than by the deleted rows'
+        # ids, so points without a row (e.g. from a partial upload) go too.
+        # The Qdrant client blocks, so the delete runs in the threadpool.
+        try:
+            await run_in_threadpool(doc_service.delete_document_vectors, document_id)
+        except Exception:
+            # The database rows are already gone; leftover vectors are harmless
+            logger.warning("Failed to delete vectors of document %s", document_id, exc_info=True)
         
         return {
             "success": True,
-            "message": f"Document '{document.title}' and all associated data deleted successfully"
+            "message": f"Document '{deleted.title}' and all associated data deleted successfully"
         }
         
     except HTTPException as e:
         raise e
     except Exception as e:
-        db.rollback()  # Roll back changes in case of error
+        await db.rollback()  # Roll back changes in case of error
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete document: {str(e)}"
@@ -7,7 +7,7 @@ from fastapi import (
     status
 )
 
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_cloudinary_service
 from app.services.file_validation_service import FileValidationService
 from app.services.cloudinary_upload_service import CloudinaryUploadService
 
@@ -16,16 +16,16 @@ file_router = APIRouter(prefix="/files", tags=["file_upload"])
 @file_router.post("/upload/document", response_model=dict)
 async def upload_document(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cloudinary_service: CloudinaryUploadService = Depends(get_cloudinary_service)
 ):
     
     try:
         # Validate document file
-        FileValidationService.validate_file(file, 'document')
+        await FileValidationService.validate_file(file, 'document')
         
         # Upload file to Cloudinary
-        cloudinary_service = CloudinaryUploadService()
-        file_url = cloudinary_service.upload_file(
+        file_url = await cloudinary_service.upload_file(
             file, 
             'document', 
             current_user['user_id']
@@ -49,16 +49,16 @@ async def upload_document(
 @file_router.post("/upload/profile-image", response_model=dict)
 async def upload_profile_image(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cloudinary_service: CloudinaryUploadService = Depends(get_cloudinary_service)
 ):
    
     try:
         # Validate image file
-        FileValidationService.validate_file(file, 'image')
+        await FileValidationService.validate_file(file, 'image')
         
         # Upload file to Cloudinary
-        cloudinary_service = CloudinaryUploadService()
-        file_url = cloudinary_service.upload_file(
+        file_url = await cloudinary_service.upload_file(
             file, 
             'image', 
             current_user['user_id']
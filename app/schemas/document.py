@@ -9,6 +9,9 @@ class DocumentUploadRequest(BaseModel):
 class DocumentChatRequest(BaseModel):
     message: str
 
+class DocumentChatBatchRequest(BaseModel):
+    messages: List[str] = Field(..., min_length=1, max_length=10)
+
 # Response schemas
 class DocumentChunkMetadata(BaseModel):
     document_id: str
@@ -32,6 +35,10 @@ class DocumentChatResponse(BaseModel):
     document_id: str
     source_documents: List[RelevantChunk]
 
+class DocumentChatBatchResponse(BaseModel):
+    document_id: str
+    answers: List[DocumentChatResponse]
+
 class ChatHistoryEntry(BaseModel):
     id: str
     timestamp: datetime
@@ -49,5 +56,12 @@ class DocumentListEntry(BaseModel):
     file_url: str
     uploaded_at: datetime
 
+class DocumentListCursor(BaseModel):
+    uploaded_at: datetime
+    id: str
+
 class DocumentListResponse(BaseModel):
-    documents: List[DocumentListEntry] 
\ No newline at end of file
+    documents: List[DocumentListEntry]
+    # Pass as ?cursor=<uploaded_at>&cursor_id=<id> to fetch the next page;
+    # None on the last page
+    next_cursor: Optional[DocumentListCursor] = None
\ No newline at end of file
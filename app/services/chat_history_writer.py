@@ -0,0 +1,118 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.models.chat_history import ChatHistory
+from app.utils.cache import invalidate_chat_history
+
+import logging
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.05  # Seconds to collect chat turns before writing them
+MAX_BATCH_SIZE = 500
+
+
+class ChatHistoryWriter:
+    """Queue chat turns and write them in batches, one transaction per flush"""
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # (user_id, document_id) -> turns queued but not yet flushed, oldest first
+        self._pending: Dict[Tuple[str, str], deque] = {}
+
+    async def enqueue(self, user_id: str, document_id: str, interactions: List[tuple]) -> None:
+        """Queue (user message, bot response) pairs for the next flush.
+
+        Returns before the turns are committed; close() on shutdown writes
+        whatever is pending.
+        """
+        self._ensure_worker()
+
+        pending = self._pending.setdefault((user_id, document_id), deque())
+        for user_message, bot_response in interactions:
+            pending.append((user_message, bot_response))
+            self._queue.put_nowait({
+                "user_id": user_id,
+                "document_id": document_id,
+                "user_message": user_message,
+                "bot_response": bot_response
+            })
+
+    def pending_turns(self, user_id: str, document_id: str) -> List[tuple]:
+        """Turns of a conversation that are queued but not yet written"""
+        return list(self._pending.get((user_id, document_id), ()))
+
+    def _ensure_worker(self) -> None:
+        # A replacement worker keeps the existing queue, so turns queued
+        # while the previous worker was stopping are still written
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            entry = await self._queue.get()
+            if entry is None:
+                return
+            pending = [entry]
+            await asyncio.sleep(FLUSH_INTERVAL)
+
+            stopping = False
+            while len(pending) < MAX_BATCH_SIZE and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    stopping = True
+                    break
+                pending.append(entry)
+
+            await self._flush(pending)
+            if stopping:
+                return
+
+    async def _flush(self, pending: List[dict]) -> None:
+        try:
+            await self._write(pending)
+        finally:
+            # Turns leave the queue in order, so each is the oldest pending
+            # turn of its conversation
+            for row in pending:
+                key = (row["user_id"], row["document_id"])
+                turns = self._pending.get(key)
+                if turns:
+                    turns.popleft()
+                    if not turns:
+                        del self._pending[key]
+
+    async def _write(self, pending: List[dict]) -> None:
+        async with self.session_factory() as db:
+            try:
+                # Rows are inserted in queue order, so clock_timestamp() keeps
+                # the turns of a conversation in order
+                await db.execute(insert(ChatHistory).values(pending))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Failed to save {len(pending)} chat history entries: {str(e)}", exc_info=True)
+                return
+
+        for user_id, document_id in {(row["user_id"], row["document_id"]) for row in pending}:
+            try:
+                await invalidate_chat_history(user_id, document_id)
+            except Exception as e:
+                # The turns are saved; a cached history page only stays stale
+                # until it expires
+                logger.error("Failed to invalidate chat history cache for document %s: %s", document_id, e)
+
+    async def close(self) -> None:
+        """Write whatever is still queued and stop the worker"""
+        if self._queue is None:
+            return
+        self._ensure_worker()
+        self._queue.put_nowait(None)
+        await self._worker
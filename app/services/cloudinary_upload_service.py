@@ -1,8 +1,10 @@
 import os
 from datetime import datetime
+from typing import Any, BinaryIO, Dict, Union
 import cloudinary
 import cloudinary.uploader
 from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 
 from app.config.cloudinary_config import (
     CLOUDINARY_CLOUD_NAME,
@@ -12,6 +14,9 @@ from app.config.cloudinary_config import (
     CLOUDINARY_PROFILE_IMAGE_FOLDER
 )
 
+# Size of each part sent by Cloudinary's chunked upload
+UPLOAD_CHUNK_SIZE = 6_000_000
+
 class CloudinaryUploadService:
     def __init__(self):
         cloudinary.config(
@@ -25,21 +30,52 @@ class CloudinaryUploadService:
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         return f"{user_id}_{timestamp}{file_extension}"
     
-    def upload_file(self, file: UploadFile, file_type: str, user_id: str) -> str:
+    async def upload_file(self, file: UploadFile, file_type: str, user_id: str) -> str:
+        await file.seek(0)
+        # The Cloudinary SDK blocks, so the upload runs in the threadpool
+        return await run_in_threadpool(self.upload_stream, file.file, file.filename, file_type, user_id)
+    
+    async def upload_path(self, file_path: str, filename: str, file_type: str, user_id: str) -> Dict[str, Any]:
+        # The SDK opens the path itself and reads it part by part. The whole
+        # upload result is returned so the asset can be removed again with
+        # delete_upload if the caller fails afterwards.
+        return await run_in_threadpool(self.upload_resource, file_path, filename, file_type, user_id)
+    
+    async def delete_upload(self, upload_result: Dict[str, Any]) -> None:
+        await run_in_threadpool(
+            cloudinary.uploader.destroy,
+            upload_result['public_id'],
+            resource_type=upload_result['resource_type']
+        )
+    
+    def upload_stream(self, stream: Union[str, BinaryIO], filename: str, file_type: str, user_id: str) -> str:
+        return self.upload_resource(stream, filename, file_type, user_id)['secure_url']
+    
+    def upload_resource(self, stream: Union[str, BinaryIO], filename: str, file_type: str, user_id: str) -> Dict[str, Any]:
         try:
             folder = (
                 CLOUDINARY_DOCUMENT_FOLDER if file_type == 'document'
                 else CLOUDINARY_PROFILE_IMAGE_FOLDER
             )
-            custom_file_name = self.generate_custom_file_name(user_id, file.filename)
+            custom_file_name = self.generate_custom_file_name(user_id, filename)
             public_id = f"{folder}/{custom_file_name}"
-            upload_result = cloudinary.uploader.upload(
-                file.file,
-                folder=folder,
-                public_id=public_id,
-                resource_type='auto'
-            )
-            return upload_result['secure_url']
+            if file_type == 'document':
+                # Documents go up in chunks so large files are never held in memory whole
+                upload_result = cloudinary.uploader.upload_large(
+                    stream,
+                    chunk_size=UPLOAD_CHUNK_SIZE,
+                    folder=folder,
+                    public_id=public_id,
+                    resource_type='auto'
+                )
+            else:
+                upload_result = cloudinary.uploader.upload(
+                    stream,
+                    folder=folder,
+                    public_id=public_id,
+                    resource_type='auto'
+                )
+            return upload_result
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,68 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.embedding_service import EMBEDDING_BATCH_SIZE
+
+import logging
+logger = logging.getLogger(__name__)
+
+# One queued batch is exactly one encoder micro-batch, so every model call
+# sees the same batch shape
+MAX_BATCH_SIZE = EMBEDDING_BATCH_SIZE
+MAX_QUEUE_TIME = 0.02  # Seconds to wait for more texts before running a partial batch
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into batched model calls"""
+
+    def __init__(self, embeddings, max_batch_size: int = MAX_BATCH_SIZE, max_queue_time: float = MAX_QUEUE_TIME):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text, sharing the model call with other pending texts"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.gather(*[self.embed(text) for text in texts])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_queue_time
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                # The model call is CPU-bound, so keep it off the event loop
+                vectors = await run_in_threadpool(self.embeddings.embed_documents, texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
@@ -0,0 +1,78 @@
+import os
+from functools import lru_cache
+from typing import List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+# Load environment variables from .env file
+from app.config import env
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384  # The dimension for all-MiniLM-L6-v2
+# int8-quantised export shipped in the model repo's onnx/ folder
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBEDDING_BATCH_SIZE = 64
+# ONNX Runtime threads per model call; half the cores leaves room for the
+# event loop and the rest of the threadpool
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    """Load the ONNX MiniLM model once per process"""
+    import onnxruntime
+    from sentence_transformers import SentenceTransformer
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.intra_op_num_threads = EMBEDDING_THREADS
+    return SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        backend="onnx",
+        model_kwargs={
+            "file_name": EMBEDDING_ONNX_FILE,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options
+        }
+    )
+
+
+def _encode(texts: List[str]):
+    return get_embedding_model().encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )
+
+
+# Chat users repeat questions, so recent query vectors are kept per process.
+# Tuples keep the cached vectors immutable.
+@lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+def _embed_query_cached(text: str) -> Tuple[float, ...]:
+    return tuple(_encode([text])[0].tolist())
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """The model's word-piece tokenizer, loadable without the ONNX session"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+
+
+def warm_up_embeddings() -> None:
+    """Load the model and run one encode so the first request doesn't pay for it"""
+    _encode(["warm up"])
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain embeddings backed by the shared int8 ONNX MiniLM model"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return _encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        # The tokenizer ignores runs of whitespace, so collapsing them first lets
+        # near-identical queries share a cache entry
+        return list(_embed_query_cached(" ".join(text.split())))
@@ -1,7 +1,8 @@
 import os
-import magic
-from typing import Union
+import aiofiles
+from typing import Optional, Union
 from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 
 from app.config.file_config import (
@@ -11,9 +12,28 @@ from app.config.file_config import (
     MAX_IMAGE_SIZE
 )
 
+# File signatures that identify a type without running libmagic. PNG and GIF
+# aren't allowed, but recognising them rejects those uploads without libmagic
+# too. DOCX is a ZIP archive and shares its header with every other ZIP, so it
+# still goes through libmagic.
+FILE_SIGNATURES = {
+    b"%PDF-": "application/pdf",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif",
+}
+
 class FileValidationService:
     @staticmethod
-    def validate_file_type(file: UploadFile, file_type: str) -> None:
+    def sniff_mime_type(header: bytes) -> Optional[str]:
+        for signature, mime in FILE_SIGNATURES.items():
+            if header.startswith(signature):
+                return mime
+        return None
+    
+    @staticmethod
+    async def validate_file_type(header: bytes, file_type: str) -> None:
         
         allowed_mime_types = (
             ALLOWED_DOCUMENT_MIME_TYPES if file_type == 'document'
@@ -22,12 +42,12 @@ class FileValidationService:
         
         
         try:
-           
-            file_content = file.file.read(2048)
-            file.file.seek(0)  
-            
-            
-            mime = magic.from_buffer(file_content, mime=True)
+            mime = FileValidationService.sniff_mime_type(header)
+            if mime is None:
+                # libmagic is only loaded once a file needs it, and it
+                # blocks, so it runs in the threadpool
+                import magic
+                mime = await run_in_threadpool(magic.from_buffer, header, mime=True)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,18 +62,13 @@ class FileValidationService:
             )
     
     @staticmethod
-    def validate_file_size(file: UploadFile, file_type: str) -> None:
+    def validate_file_size(file_size: int, file_type: str) -> None:
         
         max_size = (
             MAX_DOCUMENT_SIZE if file_type == 'document'
             else MAX_IMAGE_SIZE
         )
         
-        # Check file size
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset file pointer
-        
         if file_size > max_size:
             max_size_mb = max_size / (1024 * 1024)
             raise HTTPException(
@@ -62,11 +77,29 @@ class FileValidationService:
             )
     
     @staticmethod
-    def validate_file(file: UploadFile, file_type: str) -> None:
+    async def validate_file(file: UploadFile, file_type: str) -> None:
+        """Validate an upload from its size and leading bytes, without reading it into memory"""
+        
+        # The size is recorded while the upload is parsed; measure the spooled
+        # file only if the server didn't
+        file_size = file.size
+        if file_size is None:
+            file_size = await run_in_threadpool(file.file.seek, 0, os.SEEK_END)
+        FileValidationService.validate_file_size(file_size, file_type)
+        
+        # Validate file type from its leading bytes
+        await file.seek(0)
+        header = await file.read(2048)
+        await file.seek(0)
+        await FileValidationService.validate_file_type(header, file_type)
+    
+    @staticmethod
+    async def validate_path(file_path: str, file_type: str) -> None:
+        """Validate an upload that has already been spooled to disk"""
         
-        # Validate file type using magic
-        FileValidationService.validate_file_type(file, file_type)
+        FileValidationService.validate_file_size(os.path.getsize(file_path), file_type)
         
-        # Validate file size
-        FileValidationService.validate_file_size(file, file_type)
+        async with aiofiles.open(file_path, 'rb') as spooled_file:
+            header = await spooled_file.read(2048)
+        await FileValidationService.validate_file_type(header, file_type)
 
@@ -1,21 +1,27 @@
 import os
+import re
+import hashlib
 import uuid
-import tempfile
 import time
-from typing import List, Dict, Any
-from fastapi import UploadFile, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import datetime
-from dotenv import load_dotenv
+import asyncio
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from threading import Lock
+from cachetools import TTLCache
+from typing import List, Dict, Any, Optional, Tuple
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Load environment variables from .env file
-load_dotenv()
+from app.config import env
 
 # LangChain imports
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Qdrant
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 
 
 # Qdrant specific imports
@@ -26,67 +32,241 @@ from qdrant_client.models import Filter, FieldCondition, MatchValue
 # App imports
 from app.models.document_chunk import DocumentChunk
 from app.models.document import Document
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_service import (
+    OnnxEmbeddings, EMBEDDING_DIMENSION, EMBEDDING_BATCH_SIZE, get_tokenizer
+)
 
 import logging
 # Initialize logger
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "True").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_CLIENT_POOL_SIZE = int(os.getenv("QDRANT_CLIENT_POOL_SIZE", "4"))
+# Ping idle gRPC channels so load balancers and NATs don't drop them between
+# requests, which would cost a fresh TLS handshake on the next call
+QDRANT_GRPC_OPTIONS = {
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+    "grpc.http2.max_pings_without_data": 0,
+}
 COLLECTION_NAME = "document_chunks"
-HF_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-EMBEDDING_DIMENSION = 384  # The dimension for all-MiniLM-L6-v2
+# Chunk metadata is nested under "metadata" in each point's payload
+DOCUMENT_ID_PAYLOAD_KEY = "metadata.document_id"
+USER_ID_PAYLOAD_KEY = "metadata.user_id"
+PAYLOAD_INDEX_FIELDS = (DOCUMENT_ID_PAYLOAD_KEY, USER_ID_PAYLOAD_KEY)
+# int8 copies of the vectors stay in RAM while the float32 originals live on
+# disk and are only read to rescore the oversampled candidates
+VECTOR_QUANTIZATION = models.ScalarQuantization(
+    scalar=models.ScalarQuantizationConfig(
+        type=models.ScalarType.INT8,
+        quantile=0.99,
+        always_ram=True
+    )
+)
+# Payload fields read from search hits; page_content only exists on legacy points
+SEARCH_PAYLOAD_FIELDS = models.PayloadSelectorInclude(include=[
+    "page_content",
+    DOCUMENT_ID_PAYLOAD_KEY,
+    "metadata.chunk_index",
+    "metadata.vector_db_id"
+])
+SEARCH_CACHE_SIZE = 50_000
+SEARCH_CACHE_TTL = 600
+HNSW_CONFIG = models.HnswConfigDiff(m=16, ef_construct=128, full_scan_threshold=10000)
+# Filtered searches only ever need a handful of neighbours, so a beam smaller
+# than ef_construct keeps graph walks short
+SEARCH_PARAMS = models.SearchParams(
+    hnsw_ef=64,
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+# Chunks or vector batches buffered between document processing stages
+PIPELINE_QUEUE_SIZE = 128
+# Chunk rows collected before each COPY into document_chunks
+DB_INSERT_BATCH_SIZE = 1000
+# Columns filled by COPY; id and created_at take their server defaults
+CHUNK_COPY_COLUMNS = ("document_id", "chunk_index", "content", "vector_db_id")
 
-# Use a singleton pattern for Qdrant client
+# Parsing and splitting hold the GIL, so concurrent uploads get them in
+# separate worker processes
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(max(1, (os.cpu_count() or 2) - 1))))
+# PDF pages parsed per worker task; each window is embedded while the next
+# ones are still being parsed
+PARSE_WINDOW_PAGES = 16
+# Chunk sizes are in word-piece tokens of the embedding model, which truncates
+# its input at 256 tokens including [CLS] and [SEP]
+CHUNK_SIZE = 254
+CHUNK_OVERLAP = 48
+# Chunks shorter than this are merged into a neighbour, as long as the merged
+# chunk stays within MAX_MERGED_CHUNK_SIZE
+MIN_CHUNK_SIZE = 25
+MAX_MERGED_CHUNK_SIZE = CHUNK_SIZE
+# Neighbours are only de-duplicated when they share at least this many whole
+# words; shorter matches are more likely coincidence than splitter overlap
+MIN_OVERLAP_WORDS = 3
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().tokenize(text))
+
+
+@lru_cache(maxsize=1)
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Token-aware splitter; it holds no per-document state, so one instance serves every upload"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=count_tokens,
+    )
+
+
+def _join_adjacent(left: str, right: str) -> str:
+    """Join two neighbouring chunks without repeating the text they overlap on"""
+    # The splitter overlaps whole words, and never more words than
+    # CHUNK_OVERLAP tokens, so only that many words need comparing
+    left_words = left.rsplit(maxsplit=CHUNK_OVERLAP)[-CHUNK_OVERLAP:]
+    right_spans = list(itertools.islice(WORD_PATTERN.finditer(right), CHUNK_OVERLAP))
+    right_words = [span.group() for span in right_spans]
+    for size in range(min(len(left_words), len(right_words)), MIN_OVERLAP_WORDS - 1, -1):
+        if left_words[-size:] == right_words[:size]:
+            return left + right[right_spans[size - 1].end():]
+    return left + "\n" + right
+
+
+def merge_small_chunks(texts: List[str]) -> List[str]:
+    """Fold short split fragments into their neighbour to save an embedding each"""
+    merged, lengths = [], []
+    for text in texts:
+        length = count_tokens(text)
+        if merged and min(lengths[-1], length) < MIN_CHUNK_SIZE:
+            content = _join_adjacent(merged[-1], text)
+            content_length = count_tokens(content)
+            if content_length <= MAX_MERGED_CHUNK_SIZE:
+                merged[-1], lengths[-1] = content, content_length
+                continue
+        merged.append(text)
+        lengths.append(length)
+    return merged
+
+
+def split_page(text: str) -> List[str]:
+    return merge_small_chunks(get_text_splitter().split_text(text))
+
+
+def count_pdf_pages(file_path: str) -> int:
+    import pymupdf
+    with pymupdf.open(file_path) as pdf:
+        return pdf.page_count
+
+
+def parse_and_split(file_path: str, first_page: int = 0, page_count: Optional[int] = None) -> List[List[str]]:
+    """Parse a PDF or DOCX and split each page into chunk texts.
+
+    PDFs can be parsed a window of pages at a time; a DOCX is always parsed
+    whole. Runs in an ingest worker process, so it only takes and returns
+    plain data.
+    """
+    if file_path.lower().endswith('.pdf'):
+        import pymupdf
+        with pymupdf.open(file_path) as pdf:
+            last_page = pdf.page_count if page_count is None else min(first_page + page_count, pdf.page_count)
+            # Splitting the page text directly skips building a Document
+            # with copied metadata for every page and chunk
+            return [split_page(pdf[number].get_text()) for number in range(first_page, last_page)]
+    from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+    loader = UnstructuredWordDocumentLoader(file_path)
+    return [split_page(page.page_content) for page in loader.lazy_load()]
+
+
+_ingest_pool = None
+
+
+def get_ingest_pool() -> ProcessPoolExecutor:
+    # Workers are spawned rather than forked so they don't inherit the
+    # server's threads and open gRPC channels
+    global _ingest_pool
+    if _ingest_pool is None:
+        _ingest_pool = ProcessPoolExecutor(
+            max_workers=INGEST_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _ingest_pool
+
+
+def shutdown_ingest_pool() -> None:
+    global _ingest_pool
+    if _ingest_pool is not None:
+        _ingest_pool.shutdown(cancel_futures=True)
+        _ingest_pool = None
+
+# Shared pool of Qdrant clients, handed out round-robin
 class QdrantConnectionManager:
-    _instance = None
+    _clients = None
+    _client_cycle = None
+    _lock = Lock()
     
     @classmethod
     def get_client(cls):
-        if cls._instance is None:
-            cls._instance = QdrantClient(
-                url=QDRANT_URL, 
-                api_key=QDRANT_API_KEY,
-                timeout=30
-            )
-        return cls._instance
+        if cls._clients is None:
+            with cls._lock:
+                if cls._clients is None:
+                    # gRPC avoids JSON encoding and multiplexes calls over HTTP/2
+                    clients = [
+                        QdrantClient(
+                            url=QDRANT_URL, 
+                            api_key=QDRANT_API_KEY,
+                            prefer_grpc=QDRANT_PREFER_GRPC,
+                            grpc_port=QDRANT_GRPC_PORT,
+                            grpc_options=QDRANT_GRPC_OPTIONS,
+                            timeout=30
+                        )
+                        for _ in range(QDRANT_CLIENT_POOL_SIZE)
+                    ]
+                    cls._client_cycle = itertools.cycle(clients)
+                    cls._clients = clients
+        return next(cls._client_cycle)
 
 class LangChainDocumentService:
     def __init__(self):
-        # Initialize the HuggingFace Inference API for embeddings
-        self.embeddings = SentenceTransformerEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        # Local int8 ONNX MiniLM; the model itself is loaded once per process
+        self.embeddings = OnnxEmbeddings()
+        # Shares model calls between documents being processed at the same time
+        self.embedding_batcher = EmbeddingBatcher(self.embeddings)
+        # Search hits keyed by (document_id, k, query digest)
+        self._search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+        self._search_cache_lock = Lock()
         
-        # Initialize Qdrant client using the connection manager
+        # Check the Qdrant connection using the connection manager
+        self.qdrant_available = False
         retry_count = 0
         max_retries = 3
         while retry_count < max_retries:
             try:
-                self.client = QdrantConnectionManager.get_client()
-                collections = self.client.get_collections()
+                QdrantConnectionManager.get_client().get_collections()
+                self.qdrant_available = True
                 logger.info("Connected to Qdrant successfully")
                 break
             except Exception as e:
                 retry_count += 1
                 logger.error(f"Failed to connect to Qdrant (attempt {retry_count}): {str(e)}")
-                if retry_count >= max_retries:
-                    self.client = None
                 time.sleep(1)
         
-        # Initialize the vector store with Qdrant
-        self.vector_store = Qdrant(
-            client=self.client,
-            collection_name=COLLECTION_NAME,
-            embeddings=self.embeddings,
-        )
-
         # Initialize the collection schema
         self._initialize_collection()
     
+    @property
+    def client(self):
+        """Next pooled Qdrant client, or None if Qdrant was unreachable"""
+        if not self.qdrant_available:
+            return None
+        return QdrantConnectionManager.get_client()
+    
     def _initialize_collection(self):
         """Initialize the Qdrant collection with proper schema"""
         if not self.client:
@@ -101,10 +281,29 @@ class LangChainDocumentService:
                     collection_name=COLLECTION_NAME,
                     vectors_config=models.VectorParams(
                         size=EMBEDDING_DIMENSION,
-                        distance=models.Distance.COSINE
+                        distance=models.Distance.COSINE,
+                        on_disk=True
                     ),
-                    # Define payload schema to ensure consistency
-                    on_disk_payload=True  # Store payload on disk for large collections
+                    # Payloads only hold a few ids, so keep them in memory for filtering
+                    on_disk_payload=False,
+                    hnsw_config=HNSW_CONFIG,
+                    quantization_config=VECTOR_QUANTIZATION
+                )
+            elif self.client.get_collection(COLLECTION_NAME).config.quantization_config is None:
+                # Quantize collections created before int8 vectors were enabled
+                self.client.update_collection(
+                    collection_name=COLLECTION_NAME,
+                    quantization_config=VECTOR_QUANTIZATION
+                )
+            
+            # Keyword indexes let Qdrant apply the per-document filter while
+            # traversing the HNSW graph. Creating an index that already
+            # exists is a no-op, so existing collections get them too.
+            for field_name in PAYLOAD_INDEX_FIELDS:
+                self.client.create_payload_index(
+                    collection_name=COLLECTION_NAME,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD
                 )
         except Exception:
             pass
@@ -128,196 +327,352 @@ class LangChainDocumentService:
         except Exception:
             return False
     
-    async def process_document(self, db: Session, file: UploadFile, document_id: str, user_id: str) -> Dict[str, Any]:
-        """Process document (PDF or DOCX) with LangChain and store in Qdrant"""
-        temp_file_path = None
+    async def process_document(self, db: AsyncSession, file_path: str, document_id: str, user_id: str) -> Dict[str, Any]:
+        """Process document (PDF or DOCX) with LangChain and store in Qdrant.
+        
+        The file at file_path is owned by the caller. Chunks are inserted but
+        not committed; the caller commits them together with the document row.
+        """
         try:
-            logger.info(f"Starting document processing: document_id={document_id}, user_id={user_id}")
-
-            # Create a temporary file to store the uploaded document
-            file_extension = os.path.splitext(file.filename)[1].lower()
-            logger.info(f"File extension detected: {file_extension}")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                contents = await file.read()
-                temp_file.write(contents)
-                temp_file_path = temp_file.name
-                logger.info(f"Temporary file created at {temp_file_path}")
-
-            # Load document using appropriate LangChain loader based on file type
-            if file_extension == '.pdf':
-                loader = PyPDFLoader(temp_file_path)
-            elif file_extension == '.docx':
-                from langchain_community.document_loaders import UnstructuredWordDocumentLoader
-                loader = UnstructuredWordDocumentLoader(temp_file_path)
-            else:
-                logger.error(f"Unsupported file type: {file_extension}")
-                raise ValueError(f"Unsupported file type: {file_extension}")
+            logger.debug("Starting document processing: document_id=%s, user_id=%s", document_id, user_id)
 
-            documents = loader.load()
-            logger.info(f"{len(documents)} documents loaded successfully")
+            file_extension = os.path.splitext(file_path)[1].lower()
+            logger.debug("File extension detected: %s", file_extension)
 
-            # Split documents into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-            )
-            chunks = text_splitter.split_documents(documents)
-            logger.info(f"{len(chunks)} chunks created")
+            if file_extension not in ('.pdf', '.docx'):
+                logger.error("Unsupported file type: %s", file_extension)
+                raise ValueError(f"Unsupported file type: {file_extension}")
 
-            # Process and store chunks
+            # Parsing, embedding, upserting and row inserts run as a pipeline:
+            # a window of pages is embedded while later windows are still
+            # being parsed and earlier vectors are upserted
+            embed_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            upsert_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            insert_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
             db_chunks = []
-            vector_ids = []
-            texts = []
-            metadatas = []
-            
-            for i, chunk in enumerate(chunks):
-                vector_db_id = str(uuid.uuid4())
-                vector_ids.append(vector_db_id)
-                texts.append(chunk.page_content)
-
-                metadata = {
-                    "document_id": document_id,
-                    "user_id": user_id,
-                    "chunk_index": i,
-                    "vector_db_id": vector_db_id,
-                    "file_type": file_extension[1:],
-                    "page_content": chunk.page_content
-                }
-                chunk.metadata.update(metadata)
-                metadatas.append(metadata)
-
-                db_chunk = DocumentChunk(
-                    document_id=document_id,
-                    chunk_index=i,
-                    content=chunk.page_content,
-                    vector_db_id=vector_db_id
-                )
-                db.add(db_chunk)
-                db_chunks.append(db_chunk)
-                
-                logger.debug(f"Chunk {i} processed and stored with vector_db_id={vector_db_id}")
 
-            if chunks:
-                # Generate embeddings locally (without API call)
-                embeddings = self.embeddings.embed_documents(texts)
-
-                # Add to vector store
-                self.vector_store.add_texts(
-                    texts=texts,
-                    metadatas=metadatas,
-                    ids=vector_ids
+            async def parse_pages():
+                # Parsing and splitting run in ingest worker processes, with up
+                # to one window of pages in flight per worker
+                loop = asyncio.get_running_loop()
+                pool = get_ingest_pool()
+                if file_extension == '.pdf':
+                    page_total = await loop.run_in_executor(pool, count_pdf_pages, file_path)
+                    windows = iter(range(0, page_total, PARSE_WINDOW_PAGES))
+                    window_size = PARSE_WINDOW_PAGES
+                else:
+                    windows, window_size = iter([0]), None
+                pending = deque()
+
+                def submit_next_window():
+                    first_page = next(windows, None)
+                    if first_page is not None:
+                        pending.append(loop.run_in_executor(pool, parse_and_split, file_path, first_page, window_size))
+
+                try:
+                    for _ in range(INGEST_PROCESSES):
+                        submit_next_window()
+                    page_count = 0
+                    while pending:
+                        pages = await pending.popleft()
+                        submit_next_window()
+                        page_count += len(pages)
+                        await queue_window(pages)
+                finally:
+                    # Drop windows not yet started when the pipeline fails
+                    for window in pending:
+                        window.cancel()
+                await insert_queue.put(None)
+                await embed_queue.put(None)
+                logger.debug("%d pages loaded, %d chunks created", page_count, len(db_chunks))
+
+            async def queue_window(pages):
+                window_rows = []
+                for texts in pages:
+                    # Qdrant parses UUID ids into its native 16-byte form;
+                    # the database keeps the same string in vector_db_id
+                    vector_ids = [str(uuid.uuid4()) for _ in texts]
+                    first_index = len(db_chunks)
+                    rows = [
+                        {
+                            "document_id": document_id,
+                            "chunk_index": first_index + offset,
+                            "content": text,
+                            "vector_db_id": vector_id
+                        }
+                        for offset, (vector_id, text) in enumerate(zip(vector_ids, texts))
+                    ]
+                    db_chunks.extend(rows)
+                    window_rows.extend(rows)
+                    await insert_queue.put(rows)
+                # Embed each window in order of length so encoder batches hold
+                # chunks of similar size and little padding. Every row carries
+                # its own index and id, so nothing needs to be put back in order.
+                for row in sorted(window_rows, key=lambda row: len(row["content"])):
+                    await embed_queue.put(row)
+
+            async def embed_chunks():
+                done = False
+                while not done:
+                    # Take whatever has been parsed so far, up to one encoder batch
+                    batch = [await embed_queue.get()]
+                    while len(batch) < EMBEDDING_BATCH_SIZE and not embed_queue.empty():
+                        batch.append(embed_queue.get_nowait())
+                    if batch[-1] is None:
+                        done = True
+                        batch.pop()
+                    if batch:
+                        # Generate embeddings locally (without API call)
+                        embeddings = await self.embedding_batcher.embed_many([row["content"] for row in batch])
+                        await upsert_queue.put((batch, embeddings))
+                await upsert_queue.put(None)
+
+            async def upsert_batch(batch, embeddings, wait=False):
+                # Upsert with the vectors computed above. The payload only
+                # carries metadata; the chunk text lives in the database
+                # and is attached after search. wait=False returns once
+                # Qdrant has accepted the points, before they are applied.
+                await run_in_threadpool(
+                    self.client.upsert,
+                    collection_name=COLLECTION_NAME,
+                    wait=wait,
+                    points=[
+                        models.PointStruct(
+                            id=row["vector_db_id"],
+                            vector=embedding,
+                            payload={"metadata": {
+                                "document_id": document_id,
+                                "user_id": user_id,
+                                "chunk_index": row["chunk_index"],
+                                "vector_db_id": row["vector_db_id"],
+                                "file_type": file_extension[1:]
+                            }}
+                        )
+                        for row, embedding in zip(batch, embeddings)
+                    ]
                 )
-                logger.info(f"{len(chunks)} chunks added to vector store")
 
-            # Commit database changes
-            db.commit()
-            logger.info(f"Database committed with {len(db_chunks)} chunks")
+            async def upsert_vectors():
+                # Each batch goes out on the next pooled client, with at most
+                # one request in flight per client
+                in_flight = set()
+                last_item = None
+                try:
+                    while (item := await upsert_queue.get()) is not None:
+                        if last_item is not None:
+                            if len(in_flight) >= QDRANT_CLIENT_POOL_SIZE:
+                                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                                for task in done:
+                                    task.result()
+                            in_flight.add(asyncio.create_task(upsert_batch(*last_item)))
+                        last_item = item
+                    await asyncio.gather(*in_flight)
+                finally:
+                    # When the pipeline fails, settle the remaining upserts
+                    # before the caller deletes the document's points, so none
+                    # of them lands afterwards
+                    for task in in_flight:
+                        task.cancel()
+                    await asyncio.gather(*in_flight, return_exceptions=True)
+                # The last batch is sent after every other one was accepted and
+                # waits until it is applied. Qdrant applies updates in order,
+                # so the whole document is searchable once this returns and
+                # no partial search results get cached for it.
+                if last_item is not None:
+                    await upsert_batch(*last_item, wait=True)
+
+            async def insert_rows():
+                # Chunk rows are written while vectors are still being
+                # computed. This is the only stage that uses the session.
+                pending = []
+                while (rows := await insert_queue.get()) is not None:
+                    pending.extend(rows)
+                    if len(pending) >= DB_INSERT_BATCH_SIZE:
+                        await self._copy_chunk_rows(db, pending)
+                        pending = []
+                if pending:
+                    await self._copy_chunk_rows(db, pending)
 
-            # Clean up temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-                logger.info(f"Temporary file {temp_file_path} deleted")
+            stages = [
+                asyncio.create_task(stage())
+                for stage in (parse_pages, embed_chunks, upsert_vectors, insert_rows)
+            ]
+            try:
+                await asyncio.gather(*stages)
+            except Exception:
+                for stage in stages:
+                    stage.cancel()
+                # Wait for the stages to unwind so no upsert is still running
+                # when the caller cleans up after the failure
+                await asyncio.gather(*stages, return_exceptions=True)
+                raise
+            logger.debug("%d chunks added to vector store", len(db_chunks))
 
             return {
                 "document_id": document_id,
-                "chunks_processed": len(chunks),
+                "chunks_processed": len(db_chunks),
                 "status": "success",
                 "file_type": file_extension[1:]
             }
             
         except Exception as e:
-            logger.error(f"Error processing document {document_id}: {str(e)}", exc_info=True)
-            db.rollback()
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-                logger.info(f"Temporary file {temp_file_path} deleted due to failure")
+            logger.error("Error processing document %s: %s", document_id, e, exc_info=True)
 
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to process document: {str(e)}"
             )
     
-    def retrieve_relevant_chunks(self, query: str, document_id: str, k: int = 5) -> List[Dict[str, Any]]:
+    async def _copy_chunk_rows(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+        """Write chunk rows with COPY on the session's own connection and transaction"""
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            DocumentChunk.__tablename__,
+            records=[tuple(row[column] for column in CHUNK_COPY_COLUMNS) for row in rows],
+            columns=CHUNK_COPY_COLUMNS
+        )
+    
+    def delete_document_vectors(self, document_id: str) -> None:
+        """Delete every point of a document, including any from an unfinished upload"""
+        client = self.client
+        if client is None:
+            logger.warning("No Qdrant client; vectors of document %s were not deleted", document_id)
+            return
+        client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(filter=self._document_filter(document_id))
+        )
+    
+    @staticmethod
+    def _document_filter(document_id: str) -> Filter:
+        return Filter(
+            must=[
+                FieldCondition(
+                    key=DOCUMENT_ID_PAYLOAD_KEY,
+                    match=MatchValue(value=document_id)
+                )
+            ]
+        )
+    
+    @staticmethod
+    def _points_to_chunks(points) -> List[Dict[str, Any]]:
+        # Chunk text isn't stored in Qdrant; attach_chunk_contents fills it
+        # in from the database. Points written before that change still
+        # carry their text in the payload.
+        return [
+            {
+                "content": point.payload.get("page_content"),
+                "metadata": point.payload.get("metadata", {}),
+                "relevance_score": float(point.score)
+            }
+            for point in points
+        ]
+    
+    def retrieve_relevant_chunks(self, query: str, document_id: str, k: int = 5,
+                                 query_embedding: List[float] = None) -> List[Dict[str, Any]]:
         """Retrieve relevant document chunks for a query from a specific document"""
         try:
             # Verify we have a connection to Qdrant
-            if not self.client:
+            client = self.client
+            if not client:
                 return []
             
-            # First, verify collection has documents
-            collection_info = self.client.get_collection(COLLECTION_NAME)
+            # Repeated questions about a document reuse the earlier hits; their
+            # text is attached from the database as usual
+            cache_key = (document_id, k, hashlib.blake2b(" ".join(query.split()).encode(), digest_size=8).digest())
+            with self._search_cache_lock:
+                cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                return [dict(chunk) for chunk in cached]
             
-            if collection_info.points_count == 0:
-                return []
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(query)
             
-            # Create filter for specific document
-            filter_condition = {
-                "filter": Filter(
-                    must=[
-                        FieldCondition(
-                            key="document_id",
-                            match=MatchValue(value=document_id)
-                        )
-                    ]
-                )
-            }
-            
-            # Get results from vector store
-            results = self.vector_store.similarity_search_with_score(
-                query=query,
-                k=k,
-                **filter_condition
-            )
+            # No preflight on the collection: an empty one returns no points
+            # and a missing one raises, which falls through to the except below
+            results = client.query_points(
+                collection_name=COLLECTION_NAME,
+                query=query_embedding,
+                query_filter=self._document_filter(document_id),
+                limit=k,
+                search_params=SEARCH_PARAMS,
+                with_payload=SEARCH_PAYLOAD_FIELDS
+            ).points
             
-            if not results:
-                return []
-            
-            processed_results = []
-            for doc, score in results:
-                processed_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "relevance_score": float(score)  # Convert numpy float to Python float if needed
-                })
-            
-            return processed_results
+            chunks = self._points_to_chunks(results)
+            # Misses aren't cached: a fresh upload may still be indexing
+            if chunks:
+                with self._search_cache_lock:
+                    self._search_cache[cache_key] = [dict(chunk) for chunk in chunks]
+            return chunks
             
         except Exception:
             return []
     
-    def get_document_retriever(self, document_id: str, k: int = 5):
-        """Get a document-specific retriever for the RAG chain"""
-        # Create filter for specific document_id
-        filter_condition = {
-            "filter": Filter(
-                must=[
-                    FieldCondition(
-                        key="document_id",
-                        match=MatchValue(value=document_id)
+    def retrieve_relevant_chunks_batch(self, searches: List[Tuple[str, List[float]]],
+                                       k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Run several (document_id, query embedding) searches in one Qdrant request"""
+        try:
+            client = self.client
+            if not client:
+                return [[] for _ in searches]
+            
+            responses = client.query_batch_points(
+                collection_name=COLLECTION_NAME,
+                requests=[
+                    models.QueryRequest(
+                        query=query_embedding,
+                        filter=self._document_filter(document_id),
+                        limit=k,
+                        params=SEARCH_PARAMS,
+                        with_payload=SEARCH_PAYLOAD_FIELDS
                     )
+                    for document_id, query_embedding in searches
                 ]
-            ),
-            "k": k
-        }
+            )
+            return [self._points_to_chunks(response.points) for response in responses]
+            
+        except Exception:
+            return [[] for _ in searches]
+    
+    def invalidate_search_cache(self, document_id: str) -> None:
+        with self._search_cache_lock:
+            for key in [key for key in self._search_cache if key[0] == document_id]:
+                self._search_cache.pop(key, None)
+    
+    async def attach_chunk_contents(self, db: Optional[AsyncSession], chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in chunk text from the database for vector search results"""
+        missing = [chunk for chunk in chunks if chunk["content"] is None]
+        if missing and db is not None:
+            vector_ids = [chunk["metadata"].get("vector_db_id") for chunk in missing]
+            result = await db.execute(
+                select(DocumentChunk.vector_db_id, DocumentChunk.content).where(
+                    DocumentChunk.vector_db_id.in_(vector_ids)
+                )
+            )
+            contents = dict(result.all())
+            for chunk in missing:
+                chunk["content"] = contents.get(chunk["metadata"].get("vector_db_id"))
         
-        # Create a filtered retriever
-        return self.vector_store.as_retriever(
-            search_kwargs=filter_condition
-        )
+        # Drop hits whose rows are gone, e.g. a document deleted mid-search
+        return [chunk for chunk in chunks if chunk["content"] is not None]
 
-    def get_chunks_from_database(self, db: Session, document_id: str, k: int = 5) -> List[Dict[str, Any]]:
+    async def get_chunks_from_database(self, db: AsyncSession, document_id: str, k: int = 5) -> List[Dict[str, Any]]:
         """Retrieve document chunks directly from database when vector search fails"""
         try:
             # Get chunks from database
-            chunks = db.query(DocumentChunk).filter(
-                DocumentChunk.document_id == document_id
-            ).limit(k).all()
+            result = await db.execute(
+                select(DocumentChunk).where(
+                    DocumentChunk.document_id == document_id
+                ).limit(k)
+            )
+            chunks = result.scalars().all()
             
             # First, get the document to retrieve the user_id
             if chunks:
-                document = db.query(Document).filter(Document.id == document_id).first()
+                result = await db.execute(select(Document).where(Document.id == document_id))
+                document = result.scalars().first()
                 user_id = document.user_id if document else "unknown"
             else:
                 user_id = "unknown"
@@ -333,21 +688,23 @@ class LangChainDocumentService:
                         "vector_db_id": chunk.vector_db_id,
                         "file_type": "unknown"
                     },
-                    "relevance_score": 1.0
+                    # Fallback chunks aren't ranked against the query
+                    "relevance_score": 0.0
                 })
             
             return results
         except Exception:
             return []
     
-    def query_document(self, db: Session, document_id: str, query: str, k: int = 5):
+    async def query_document(self, db: AsyncSession, document_id: str, query: str, k: int = 5):
         """Query a document by ID and return relevant chunks"""
         # First try vector search
-        results = self.retrieve_relevant_chunks(query, document_id, k)
+        results = await run_in_threadpool(self.retrieve_relevant_chunks, query, document_id, k)
+        results = await self.attach_chunk_contents(db, results)
         
         # If no results, fall back to database retrieval
         if not results:
-            results = self.get_chunks_from_database(db, document_id, k)
+            results = await self.get_chunks_from_database(db, document_id, k)
         
         return {
             "document_id": document_id,
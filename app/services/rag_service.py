@@ -1,39 +1,70 @@
 import os
-from typing import List, Dict, Any
+import re
+import asyncio
+from typing import AsyncIterator, List, Dict, Any, Optional
+from cachetools import TTLCache
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
-from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Load environment variables from .env file
-load_dotenv()
-
-# LangChain imports
-from langchain_core.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from langchain_huggingface import HuggingFaceEndpoint
+from app.config import env
 
 # App imports
 from app.services.langchain_document_service import LangChainDocumentService
+from app.services.chat_history_writer import ChatHistoryWriter
 from app.models.chat_history import ChatHistory
 
+import logging
+logger = logging.getLogger(__name__)
+
 # Hugging Face configuration
 HF_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 MISTRAL_MODEL_NAME = os.getenv("MISTRAL_MODEL_NAME", "mistralai/Mistral-7B-Instruct-v0.2")
 
+# Recent turns used as conversation context, cached per (user, document) and
+# kept current as new turns are recorded. The TTL bounds staleness across
+# worker processes.
+CHAT_HISTORY_TURNS = 5
+RECENT_HISTORY_CACHE_SIZE = 4096
+RECENT_HISTORY_CACHE_TTL = 300
+
+# Fixed parts of the RAG prompt
+PROMPT_PREFIX = "Answer the following question based only on the provided context:\n\nContext:\n"
+PROMPT_HISTORY_HEADER = "Previous conversation (most recent only):\n"
+
+# A top hit at least this similar that contains every keyword of the question
+# is answered from the chunk itself, without calling the LLM
+EXTRACTIVE_ANSWER_MIN_SCORE = 0.88
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me of on or "
+    "please show tell that the this to was what when where which who why with".split()
+)
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
 class RAGService:
-    def __init__(self):
-        # Init document service with Qdrant
-        self.doc_service = LangChainDocumentService()
+    def __init__(self, doc_service: Optional[LangChainDocumentService] = None,
+                 history_writer: Optional[ChatHistoryWriter] = None):
+        # Init document service with Qdrant, sharing the app's instance when given
+        self.doc_service = doc_service or LangChainDocumentService()
+        # Turns still queued in the writer are added to the history read back
+        self.history_writer = history_writer
+        self._recent_history = TTLCache(maxsize=RECENT_HISTORY_CACHE_SIZE, ttl=RECENT_HISTORY_CACHE_TTL)
         
         try:
-            # Init the LLM using Hugging Face Inference API
+            # Init the LLM using Hugging Face Inference API. Imported here so
+            # that routes that never touch the LLM don't pay for the import.
+            from langchain_huggingface import HuggingFaceEndpoint
             self.llm = HuggingFaceEndpoint(
                 repo_id=MISTRAL_MODEL_NAME,
                 huggingfacehub_api_token=HF_API_KEY,
                 task="text-generation",
                 temperature=0.2,
                 max_new_tokens=512,
-                do_sample=True
+                do_sample=True,
+                streaming=True
             )
             
             # Verify Qdrant collection
@@ -41,73 +72,31 @@ class RAGService:
             
         except Exception as e:
             raise
-        
-        # Customize the single-document RAG prompt
-        template = """
-        You are a helpful document assistant. Use the following context from the document to answer the user's question.
-        If you don't know the answer based on the context, just say that the information is not in the document.
-        
-        Context: {context}
-        
-        Chat History: {chat_history}
-        
-        Question: {question}
-        
-        Answer:
-        """
-        
-        self.prompt = PromptTemplate(
-            template=template,
-            input_variables=["context", "chat_history", "question"]
-        )
     
-    def query_document(self, query: str, document_id: str, db: Session = None, chat_history=None, top_k: int = 5):
+    async def query_document(self, query: str, document_id: str, db: AsyncSession = None, chat_history=None, top_k: int = 5,
+                             query_embedding: List[float] = None):
         """Query a specific document using direct vector retrieval"""
         try:
-            # 1. First, attempt to retrieve relevant chunks via vector search
-            chunks = self.doc_service.retrieve_relevant_chunks(query, document_id, top_k)
-            
-            # If no chunks found via vector search and db is provided, fall back to database retrieval
-            if not chunks and db is not None:
-                chunks = self.doc_service.get_chunks_from_database(db, document_id, top_k)
+            # 1. Retrieve the relevant chunks
+            chunks = await self.retrieve_context(query, document_id, db, top_k, query_embedding)
             
             # Handle empty results
             if not chunks:
+                return self._no_results_response(document_id)
+            
+            extractive_answer = self._extractive_answer(query, chunks)
+            if extractive_answer is not None:
                 return {
-                    "answer": "I couldn't find any relevant information about this in the document. Please try rephrasing your question or ask about a different topic covered in the document.",
-                    "source_documents": [],
+                    "answer": extractive_answer,
+                    "source_documents": chunks[:1],
                     "document_id": document_id
                 }
             
-            # 2. Format the context from retrieved chunks
-            context = "\n\n".join([chunk["content"] for chunk in chunks])
-            
-            # 3. Format chat history if provided (limited to last 5 interactions)
-            chat_history_text = ""
-            if chat_history and len(chat_history) > 0:
-                # Only include up to 5 most recent interactions
-                recent_history = chat_history[-5:] if len(chat_history) > 5 else chat_history
-                
-                history_items = []
-                for user_msg, bot_msg in recent_history:
-                    history_items.append(f"User: {user_msg}\nAssistant: {bot_msg}")
-                chat_history_text = "\n\n".join(history_items)
-            
-            # 4. Create a prompt with context and chat history
-            prompt = f"""
-            Answer the following question based only on the provided context:
-            
-            Context:
-            {context}
-            
-            {f"Previous conversation (most recent only):\n{chat_history_text}\n\n" if chat_history_text else ""}
-            Question: {query}
+            # 2. Build the prompt from the chunks and chat history
+            prompt = self._build_prompt(query, chunks, chat_history)
             
-            Answer:
-            """
-            
-            # 5. Send directly to LLM
-            response = self.llm.invoke(prompt)
+            # 3. Send directly to LLM over its async client
+            response = await self.llm.ainvoke(prompt)
             
             return {
                 "answer": response,
@@ -119,48 +108,173 @@ class RAGService:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to query document: {str(e)}"
             )
-            
-    def save_chat_history(self, db: Session, user_id: str, document_id: str, 
-                         user_message: str, bot_response: str) -> ChatHistory:
-        """Save chat interaction to database"""
+    
+    async def retrieve_context(self, query: str, document_id: str, db: AsyncSession = None, top_k: int = 5,
+                               query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+        """Find the chunks to answer a question from, falling back to the database"""
+        # The search client is blocking, so it runs in the threadpool
+        chunks = await run_in_threadpool(
+            self.doc_service.retrieve_relevant_chunks, query, document_id, top_k, query_embedding
+        )
+        # Vector hits carry ids only; their text comes from the database
+        chunks = await self.doc_service.attach_chunk_contents(db, chunks)
+        
+        # If no chunks found via vector search and db is provided, fall back to database retrieval
+        if not chunks and db is not None:
+            chunks = await self.doc_service.get_chunks_from_database(db, document_id, top_k)
+        return chunks
+    
+    async def stream_answer(self, query: str, document_id: str, chunks: List[Dict[str, Any]],
+                            chat_history=None) -> AsyncIterator[str]:
+        """Yield the answer as the LLM generates it"""
+        if not chunks:
+            yield self._no_results_response(document_id)["answer"]
+            return
+        extractive_answer = self._extractive_answer(query, chunks)
+        if extractive_answer is not None:
+            yield extractive_answer
+            return
+        async for token in self.llm.astream(self._build_prompt(query, chunks, chat_history)):
+            yield token
+    
+    async def query_document_batch(self, queries: List[str], document_id: str, db: AsyncSession = None,
+                                   chat_history=None, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Answer several questions about one document, overlapping retrieval and generation"""
         try:
-            chat_entry = ChatHistory(
-                user_id=user_id,
-                document_id=document_id,
-                user_message=user_message,
-                bot_response=bot_response
+            # Embed all questions in one batch, then send every search in one request
+            query_embeddings = await run_in_threadpool(self.doc_service.embeddings.embed_documents, queries)
+            chunk_sets = await run_in_threadpool(
+                self.doc_service.retrieve_relevant_chunks_batch,
+                [(document_id, embedding) for embedding in query_embeddings],
+                top_k
             )
             
-            db.add(chat_entry)
-            db.commit()
-            db.refresh(chat_entry)
+            # Attach the text of every hit with a single database query
+            await self.doc_service.attach_chunk_contents(db, [chunk for chunks in chunk_sets for chunk in chunks])
+            chunk_sets = [
+                [chunk for chunk in chunks if chunk["content"] is not None]
+                for chunks in chunk_sets
+            ]
+            
+            # One database fallback serves every question the vector search missed;
+            # the session can't be shared between concurrent tasks
+            if db is not None and not all(chunk_sets):
+                fallback_chunks = await self.doc_service.get_chunks_from_database(db, document_id, top_k)
+                chunk_sets = [chunks or fallback_chunks for chunks in chunk_sets]
             
-            return chat_entry
+            extractive_answers = [
+                self._extractive_answer(query, chunks) if chunks else None
+                for query, chunks in zip(queries, chunk_sets)
+            ]
+            answers = await asyncio.gather(*[
+                self.llm.ainvoke(self._build_prompt(query, chunks, chat_history))
+                for query, chunks, extractive_answer in zip(queries, chunk_sets, extractive_answers)
+                if chunks and extractive_answer is None
+            ])
             
+            answer_iter = iter(answers)
+            results = []
+            for chunks, extractive_answer in zip(chunk_sets, extractive_answers):
+                if not chunks:
+                    results.append(self._no_results_response(document_id))
+                    continue
+                if extractive_answer is not None:
+                    results.append({
+                        "answer": extractive_answer,
+                        "source_documents": chunks[:1],
+                        "document_id": document_id
+                    })
+                    continue
+                results.append({
+                    "answer": next(answer_iter),
+                    "source_documents": chunks,
+                    "document_id": document_id
+                })
+            return results
         except Exception as e:
-            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to save chat history: {str(e)}"
+                detail=f"Failed to query document: {str(e)}"
             )
+    
+    def answer_sources(self, query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The chunks an answer is attributed to; an extractive answer quotes only the top one"""
+        if chunks and self._extractive_answer(query, chunks) is not None:
+            return chunks[:1]
+        return chunks
+    
+    @staticmethod
+    def _extractive_answer(query: str, chunks: List[Dict[str, Any]]) -> Optional[str]:
+        """The sentence of a near-exact top hit that best covers the question, if there is one"""
+        top_chunk = max(chunks, key=lambda chunk: chunk["relevance_score"])
+        if top_chunk["relevance_score"] < EXTRACTIVE_ANSWER_MIN_SCORE:
+            return None
+        
+        keywords = {word for word in WORD_PATTERN.findall(query.lower()) if word not in STOPWORDS}
+        content = top_chunk["content"]
+        if not keywords or not keywords <= set(WORD_PATTERN.findall(content.lower())):
+            return None
+        
+        return max(
+            SENTENCE_PATTERN.split(content.strip()),
+            key=lambda sentence: len(keywords & set(WORD_PATTERN.findall(sentence.lower())))
+        )
+    
+    def _no_results_response(self, document_id: str) -> Dict[str, Any]:
+        return {
+            "answer": "I couldn't find any relevant information about this in the document. Please try rephrasing your question or ask about a different topic covered in the document.",
+            "source_documents": [],
+            "document_id": document_id
+        }
+    
+    def _build_prompt(self, query: str, chunks: List[Dict[str, Any]], chat_history=None) -> str:
+        # Format the context from retrieved chunks. They are put in document
+        # order rather than score order so the same set of chunks always
+        # produces the same prompt prefix, which the inference server can reuse
+        ordered_chunks = sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+        context = "\n\n".join(chunk["content"] for chunk in ordered_chunks)
+        
+        # Format chat history if provided (limited to last 5 interactions)
+        history_section = ""
+        if chat_history:
+            chat_history_text = "\n\n".join(
+                f"User: {user_msg}\nAssistant: {bot_msg}"
+                for user_msg, bot_msg in chat_history[-CHAT_HISTORY_TURNS:]
+            )
+            history_section = f"{PROMPT_HISTORY_HEADER}{chat_history_text}\n\n"
+        
+        # Create a prompt with context and chat history
+        return f"{PROMPT_PREFIX}{context}\n\n{history_section}Question: {query}\n\nAnswer:"
             
-    def get_chat_history(self, db: Session, user_id: str, document_id: str) -> List[tuple]:
+    async def get_chat_history(self, db: AsyncSession, user_id: str, document_id: str) -> List[tuple]:
         """Get limited chat history (last 5 entries) for RAG context"""
+        cached = self._recent_history.get((user_id, document_id))
+        if cached is not None:
+            return list(cached)
+        
+        key = (user_id, document_id)
         try:
+            queued_before = self._pending_turns(user_id, document_id)
             # Get only the last 5 interactions to avoid context length issues
-            history = db.query(ChatHistory).filter(
-                ChatHistory.user_id == user_id,
-                ChatHistory.document_id == document_id
-            ).order_by(ChatHistory.timestamp.desc()).limit(5).all()
-            
-            # Reverse the list to get chronological order (oldest first)
-            history.reverse()
+            # Only the two text columns are needed, so no ORM objects are built
+            result = await db.execute(
+                select(ChatHistory.user_message, ChatHistory.bot_response).where(
+                    ChatHistory.user_id == user_id,
+                    ChatHistory.document_id == document_id
+                ).order_by(ChatHistory.timestamp.desc()).limit(CHAT_HISTORY_TURNS)
+            )
             
-            # Format for LangChain's memory format
-            formatted_history = [
-                (entry.user_message, entry.bot_response) for entry in history
-            ]
+            # Reverse to get chronological order (oldest first), formatted for
+            # LangChain's memory format
+            formatted_history = [tuple(row) for row in reversed(result.all())]
             
+            # Turns still waiting in the writer aren't in the database yet.
+            # The result is only cached when none were queued around the
+            # read, so the cache never misses a turn until it expires.
+            queued = self._pending_turns(user_id, document_id)
+            formatted_history = (formatted_history + queued)[-CHAT_HISTORY_TURNS:]
+            if not queued_before and not queued:
+                self._recent_history[key] = tuple(formatted_history)
             return formatted_history
             
         except Exception as e:
@@ -169,14 +283,29 @@ class RAGService:
                 detail=f"Failed to retrieve chat history: {str(e)}"
             )
             
-    def get_full_chat_history(self, db: Session, user_id: str, document_id: str) -> List[ChatHistory]:
+    def _pending_turns(self, user_id: str, document_id: str) -> List[tuple]:
+        if self.history_writer is None:
+            return []
+        return self.history_writer.pending_turns(user_id, document_id)
+    
+    def record_chat_turns(self, user_id: str, document_id: str, interactions: List[tuple]) -> None:
+        """Append new (user message, bot response) pairs to the cached recent history"""
+        key = (user_id, document_id)
+        cached = self._recent_history.get(key)
+        if cached is not None:
+            self._recent_history[key] = (cached + tuple(interactions))[-CHAT_HISTORY_TURNS:]
+    
+    async def get_full_chat_history(self, db: AsyncSession, user_id: str, document_id: str) -> List[ChatHistory]:
         """Get complete chat history for UI display"""
         try:
             # Get all chat history for the document
-            history = db.query(ChatHistory).filter(
-                ChatHistory.user_id == user_id,
-                ChatHistory.document_id == document_id
-            ).order_by(ChatHistory.timestamp).all()
+            result = await db.execute(
+                select(ChatHistory).where(
+                    ChatHistory.user_id == user_id,
+                    ChatHistory.document_id == document_id
+                ).order_by(ChatHistory.timestamp)
+            )
+            history = result.scalars().all()
             
             return history
             
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Questions whose embeddings are at least this similar get the cached answer
+SIMILARITY_THRESHOLD = 0.95
+CACHE_TTL = 24 * 60 * 60
+MAX_ENTRIES_PER_DOCUMENT = 256
+MAX_CACHED_DOCUMENTS = 1024
+
+
+class SemanticCacheService:
+    """Cache chat answers by question embedding, scoped to a user's document"""
+
+    def __init__(self):
+        # (user_id, document_id) -> list of (expires_at, embedding, result),
+        # least recently used scope and entry first
+        self._scopes: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        # float16 halves the memory held per cached question
+        return vector.astype(np.float16)
+
+    def lookup(self, user_id: str, document_id: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a near-identical earlier question"""
+        key = (user_id, document_id)
+        query = self._normalize(embedding).astype(np.float32)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._scopes.get(key)
+            if not entries:
+                return None
+
+            entries[:] = [entry for entry in entries if entry[0] > now]
+            if not entries:
+                del self._scopes[key]
+                return None
+            self._scopes.move_to_end(key)
+
+            # Entries are unit vectors, so the dot product is the cosine similarity
+            matrix = np.stack([entry[1] for entry in entries]).astype(np.float32)
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= SIMILARITY_THRESHOLD:
+                # Keep frequently asked questions from being evicted
+                entry = entries.pop(best)
+                entries.append(entry)
+                return entry[2]
+        return None
+
+    def store(self, user_id: str, document_id: str, embedding: List[float], result: Dict[str, Any]) -> None:
+        key = (user_id, document_id)
+        entry = (time.monotonic() + CACHE_TTL, self._normalize(embedding), result)
+
+        with self._lock:
+            entries = self._scopes.setdefault(key, [])
+            entries.append(entry)
+            if len(entries) > MAX_ENTRIES_PER_DOCUMENT:
+                del entries[0]
+            self._scopes.move_to_end(key)
+            if len(self._scopes) > MAX_CACHED_DOCUMENTS:
+                self._scopes.popitem(last=False)
+
+    def invalidate(self, user_id: str, document_id: str) -> None:
+        with self._lock:
+            self._scopes.pop((user_id, document_id), None)
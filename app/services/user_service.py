@@ -1,11 +1,27 @@
-from sqlalchemy.orm import Session
+from threading import Lock
+from cachetools import TTLCache
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from fastapi import HTTPException, status
 from app.models.user import User
 from app.schemas.user import EmailSignInData, UserProfileUpdate
 
+# Users returned by get_or_create_user, keyed by Firebase uid
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 600  # Seconds
+
 class UserService:
-    def create_user(self, db: Session, firebase_uid: str, user_data: EmailSignInData) -> User:
+    def __init__(self):
+        self._user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self._user_cache_lock = Lock()
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._user_cache_lock:
+            self._user_cache.pop(user_id, None)
+
+    async def create_user(self, db: AsyncSession, firebase_uid: str, user_data: EmailSignInData) -> User:
         try:
             user = User(
                 id=firebase_uid,
@@ -16,31 +32,31 @@ class UserService:
                 bio=user_data.bio
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
             return user
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="User with this email already exists"
             )
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Database error: {str(e)}"
             )
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"An unexpected error occurred: {str(e)}"
             )
 
-    def get_user_by_id(self, db: Session, user_id: str) -> User:
+    async def get_user_by_id(self, db: AsyncSession, user_id: str) -> User:
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            # Primary-key lookup; served from the identity map when already loaded
+            user = await db.get(User, user_id)
             if not user:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -58,59 +74,77 @@ class UserService:
                 detail=f"An unexpected error occurred: {str(e)}"
             )
 
-    def get_or_create_user(self, db: Session, firebase_uid: str, email: str, name: str) -> User:
+    async def get_or_create_user(self, db: AsyncSession, firebase_uid: str, email: str, name: str) -> User:
+        with self._user_cache_lock:
+            user = self._user_cache.get(firebase_uid)
+        if user is not None:
+            return user
         try:
-            user = db.query(User).filter(User.id == firebase_uid).first()
-            if user:
-                return user
-            user = User(
-                id=firebase_uid,
-                email=email,
-                name=name,
-                is_active=True
+            # New users are created in one round trip. Only a conflict on the
+            # uid is ignored, so a duplicate email still raises IntegrityError.
+            result = await db.scalars(
+                insert(User)
+                .values(id=firebase_uid, email=email, name=name, is_active=True)
+                .on_conflict_do_nothing(index_elements=[User.id])
+                .returning(User)
             )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+            user = result.one_or_none()
+            if user is None:
+                user = await db.get(User, firebase_uid)
+            await db.commit()
+            with self._user_cache_lock:
+                self._user_cache[firebase_uid] = user
             return user
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="User with this email already exists"
             )
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Database error: {str(e)}"
             )
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"An unexpected error occurred: {str(e)}"
             )
 
-    def update_user_profile(self, db: Session, user_id: str, profile_data: UserProfileUpdate) -> User:
+    async def update_user_profile(self, db: AsyncSession, user_id: str, profile_data: UserProfileUpdate) -> User:
         try:
-            user = self.get_user_by_id(db, user_id)
             update_data = profile_data.dict(exclude_unset=True)
-            for key, value in update_data.items():
-                setattr(user, key, value)
-            db.commit()
-            db.refresh(user)
+            if not update_data:
+                return await self.get_user_by_id(db, user_id)
+            # Update and read back the row in one statement
+            result = await db.scalars(
+                update(User)
+                .where(User.id == user_id)
+                .values(**update_data)
+                .returning(User)
+            )
+            user = result.one_or_none()
+            if not user:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="User not found"
+                )
+            await db.commit()
+            self.invalidate_user(user_id)
             return user
         except HTTPException as e:
             raise e
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Database error: {str(e)}"
             )
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"An unexpected error occurred: {str(e)}"
@@ -0,0 +1,38 @@
+import os
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from app.config import env  # Load environment variables from the .env file
+
+# Without REDIS_URL responses are cached per worker process
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_PREFIX = "documind"
+DOCUMENT_LIST_CACHE_TTL = 30
+CHAT_HISTORY_CACHE_TTL = 60
+
+
+def initialize_cache():
+    if REDIS_URL:
+        from redis import asyncio as aioredis
+        from fastapi_cache.backends.redis import RedisBackend
+        backend = RedisBackend(aioredis.from_url(REDIS_URL))
+    else:
+        backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix=CACHE_PREFIX)
+
+
+# Keys are scoped as "<namespace>:<user>[:<document>]:..." so that a user's
+# entries can be cleared by namespace
+def document_list_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    return f"{namespace}:{kwargs['current_user']['uid']}:list:{kwargs.get('cursor')}:{kwargs.get('cursor_id')}"
+
+
+def chat_history_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    return f"{namespace}:{kwargs['current_user']['uid']}:{kwargs['document_id']}:history"
+
+
+async def invalidate_document_list(user_id: str):
+    await FastAPICache.clear(namespace=f"docs:{user_id}")
+
+
+async def invalidate_chat_history(user_id: str, document_id: str):
+    await FastAPICache.clear(namespace=f"chat:{user_id}:{document_id}")
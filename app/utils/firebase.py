@@ -1,17 +1,24 @@
 import os
+from functools import lru_cache
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import HTTPException, status
-from dotenv import load_dotenv
+from app.config import env  # Load environment variables from the .env file
 
-load_dotenv()
+SERVICE_ACCOUNT_KEY_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
 
 
-def initialize_firebase():
-    
-    SERVICE_ACCOUNT_KEY_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
+@lru_cache(maxsize=None)
+def initialize_firebase() -> firebase_admin.App:
+    """Initialize the default Firebase app once per process and return it"""
+    # initialize_app raises if the default app already exists, e.g. when the
+    # app is started again in the same process by tests or a reloader
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
     cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_PATH)
-    firebase_admin.initialize_app(cred)
+    return firebase_admin.initialize_app(cred)
 
 
 def verify_token(id_token: str):
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from app import dependencies
+
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    calls = []
+
+    def fake_verify_token(id_token):
+        calls.append(id_token)
+        return {"uid": f"uid-{id_token}", "exp": expiries.get(id_token, time.time() + 3600)}
+
+    expiries = {}
+    monkeypatch.setattr(dependencies, "verify_token", fake_verify_token)
+    dependencies._token_cache.clear()
+    yield calls, expiries
+    dependencies._token_cache.clear()
+
+
+def test_repeat_token_is_verified_once(verify_calls):
+    calls, _ = verify_calls
+    first = dependencies.verify_token_cached("token-a")
+    second = dependencies.verify_token_cached("token-a")
+    assert first == second == {"uid": "uid-token-a", "exp": first["exp"]}
+    assert calls == ["token-a"]
+
+
+def test_tokens_are_cached_separately(verify_calls):
+    calls, _ = verify_calls
+    assert dependencies.verify_token_cached("token-a")["uid"] == "uid-token-a"
+    assert dependencies.verify_token_cached("token-b")["uid"] == "uid-token-b"
+    assert calls == ["token-a", "token-b"]
+
+
+def test_token_close_to_expiry_is_not_cached(verify_calls):
+    calls, expiries = verify_calls
+    expiries["token-a"] = time.time() + dependencies.TOKEN_EXPIRY_MARGIN / 2
+    dependencies.verify_token_cached("token-a")
+    dependencies.verify_token_cached("token-a")
+    assert calls == ["token-a", "token-a"]
+
+
+def test_failed_verification_is_not_cached(verify_calls, monkeypatch):
+    def rejecting_verify_token(id_token):
+        raise dependencies.HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+    monkeypatch.setattr(dependencies, "verify_token", rejecting_verify_token)
+    with pytest.raises(dependencies.HTTPException):
+        dependencies.verify_token_cached("bad-token")
+    assert len(dependencies._token_cache) == 0
@@ -0,0 +1,15 @@
+from app.routes.document_routes import sse_event
+
+
+def test_sse_event_without_name():
+    assert sse_event("hello") == "data: hello\n\n"
+
+
+def test_sse_event_with_name():
+    assert sse_event('{"source_documents": []}', event="sources") == (
+        'event: sources\ndata: {"source_documents": []}\n\n'
+    )
+
+
+def test_sse_event_splits_multiline_data():
+    assert sse_event("first\nsecond") == "data: first\ndata: second\n\n"
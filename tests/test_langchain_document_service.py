@@ -0,0 +1,20 @@
+from app.services.langchain_document_service import _join_adjacent
+
+
+def test_join_adjacent_removes_splitter_overlap():
+    left = "The service starts the ingest workers and then the quick brown fox"
+    right = "then the quick brown fox jumps over the lazy dog"
+    assert _join_adjacent(left, right) == (
+        "The service starts the ingest workers and then the quick brown fox jumps over the lazy dog"
+    )
+
+
+def test_join_adjacent_keeps_non_overlapping_neighbour():
+    assert _join_adjacent("Section 1: Overview", "when the system starts") == (
+        "Section 1: Overview\nwhen the system starts"
+    )
+    assert _join_adjacent("Total: 12", "2024 budget") == "Total: 12\n2024 budget"
+
+
+def test_join_adjacent_ignores_short_word_matches():
+    assert _join_adjacent("see the", "the appendix") == "see the\nthe appendix"
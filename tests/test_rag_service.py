@@ -0,0 +1,43 @@
+from app.services.rag_service import EXTRACTIVE_ANSWER_MIN_SCORE, RAGService
+
+CONTENT = "The warranty lasts two years. Returns are accepted within 30 days of purchase."
+
+
+def chunk(content, score):
+    return {"content": content, "relevance_score": score, "metadata": {"chunk_index": 0}}
+
+
+def test_extractive_answer_returns_best_covering_sentence():
+    chunks = [chunk(CONTENT, 0.95), chunk("Unrelated text.", 0.5)]
+    assert RAGService._extractive_answer("Is the warranty two years?", chunks) == (
+        "The warranty lasts two years."
+    )
+
+
+def test_extractive_answer_uses_the_top_scoring_chunk():
+    chunks = [chunk("Nothing useful here.", 0.6), chunk(CONTENT, 0.95)]
+    assert RAGService._extractive_answer("When are returns accepted?", chunks) == (
+        "Returns are accepted within 30 days of purchase."
+    )
+
+
+def test_extractive_answer_needs_the_score_threshold():
+    query = "Is the warranty two years?"
+    assert RAGService._extractive_answer(query, [chunk(CONTENT, EXTRACTIVE_ANSWER_MIN_SCORE)]) is not None
+    assert RAGService._extractive_answer(query, [chunk(CONTENT, EXTRACTIVE_ANSWER_MIN_SCORE - 0.01)]) is None
+
+
+def test_extractive_answer_needs_every_keyword():
+    assert RAGService._extractive_answer("Does the warranty cover batteries?", [chunk(CONTENT, 0.95)]) is None
+
+
+def test_extractive_answer_skips_queries_without_keywords():
+    assert RAGService._extractive_answer("", [chunk(CONTENT, 0.95)]) is None
+    assert RAGService._extractive_answer("What is it?", [chunk(CONTENT, 0.95)]) is None
+
+
+def test_answer_sources_match_the_answer_path():
+    service = RAGService.__new__(RAGService)
+    chunks = [chunk(CONTENT, 0.95), chunk("Unrelated text.", 0.5)]
+    assert service.answer_sources("Is the warranty two years?", chunks) == chunks[:1]
+    assert service.answer_sources("Does the warranty cover batteries?", chunks) == chunks
@@ -0,0 +1,85 @@
+import pytest
+
+from app.services import semantic_cache_service
+from app.services.semantic_cache_service import SemanticCacheService
+
+QUESTION = [1.0, 0.0, 0.0]
+# Cosine similarity with QUESTION of about 0.995, above SIMILARITY_THRESHOLD
+SIMILAR_QUESTION = [0.99, 0.1, 0.0]
+# Cosine similarity with QUESTION of about 0.707
+DIFFERENT_QUESTION = [0.7, 0.7, 0.0]
+
+
+def result(answer):
+    return {"answer": answer, "source_documents": [], "document_id": "doc-1"}
+
+
+@pytest.fixture
+def cache():
+    return SemanticCacheService()
+
+
+def test_similar_question_hits(cache):
+    cache.store("user-1", "doc-1", QUESTION, result("cached"))
+    assert cache.lookup("user-1", "doc-1", SIMILAR_QUESTION) == result("cached")
+
+
+def test_question_below_threshold_misses(cache):
+    cache.store("user-1", "doc-1", QUESTION, result("cached"))
+    assert cache.lookup("user-1", "doc-1", DIFFERENT_QUESTION) is None
+
+
+def test_best_match_is_returned(cache):
+    cache.store("user-1", "doc-1", DIFFERENT_QUESTION, result("other"))
+    cache.store("user-1", "doc-1", QUESTION, result("closest"))
+    assert cache.lookup("user-1", "doc-1", SIMILAR_QUESTION) == result("closest")
+
+
+def test_entries_are_scoped_to_user_and_document(cache):
+    cache.store("user-1", "doc-1", QUESTION, result("cached"))
+    assert cache.lookup("user-1", "doc-2", QUESTION) is None
+    assert cache.lookup("user-2", "doc-1", QUESTION) is None
+
+
+def test_invalidate_drops_only_that_document(cache):
+    cache.store("user-1", "doc-1", QUESTION, result("first"))
+    cache.store("user-1", "doc-2", QUESTION, result("second"))
+    cache.invalidate("user-1", "doc-1")
+    assert cache.lookup("user-1", "doc-1", QUESTION) is None
+    assert cache.lookup("user-1", "doc-2", QUESTION) == result("second")
+
+
+def test_expired_entries_miss(cache, monkeypatch):
+    cache.store("user-1", "doc-1", QUESTION, result("cached"))
+    now = semantic_cache_service.time.monotonic()
+    monkeypatch.setattr(
+        semantic_cache_service.time, "monotonic",
+        lambda: now + semantic_cache_service.CACHE_TTL + 1
+    )
+    assert cache.lookup("user-1", "doc-1", QUESTION) is None
+
+
+def test_least_recently_used_document_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(semantic_cache_service, "MAX_CACHED_DOCUMENTS", 2)
+    cache.store("user-1", "doc-1", QUESTION, result("first"))
+    cache.store("user-1", "doc-2", QUESTION, result("second"))
+    # A hit makes doc-1 the most recently used document
+    assert cache.lookup("user-1", "doc-1", QUESTION) == result("first")
+    cache.store("user-1", "doc-3", QUESTION, result("third"))
+
+    assert cache.lookup("user-1", "doc-2", QUESTION) is None
+    assert cache.lookup("user-1", "doc-1", QUESTION) == result("first")
+    assert cache.lookup("user-1", "doc-3", QUESTION) == result("third")
+
+
+def test_least_recently_used_entry_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(semantic_cache_service, "MAX_ENTRIES_PER_DOCUMENT", 2)
+    cache.store("user-1", "doc-1", QUESTION, result("first"))
+    cache.store("user-1", "doc-1", DIFFERENT_QUESTION, result("second"))
+    # A hit moves the first entry to the most recently used end
+    assert cache.lookup("user-1", "doc-1", QUESTION) == result("first")
+    cache.store("user-1", "doc-1", [0.0, 0.0, 1.0], result("third"))
+
+    assert cache.lookup("user-1", "doc-1", DIFFERENT_QUESTION) is None
+    assert cache.lookup("user-1", "doc-1", QUESTION) == result("first")
+    assert cache.lookup("user-1", "doc-1", [0.0, 0.0, 1.0]) == result("third")